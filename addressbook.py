@@ -0,0 +1,68 @@
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+class AddressBook:
+    """
+    Shared wallet address dictionary.
+
+    Maps each address to a compact int32 id. Ids are only ever appended, so
+    they stay stable while the dataset grows and aggregates keyed by id can
+    be reused across refreshes.
+    """
+
+    def __init__(self):
+        self.index = pd.Index([], dtype=object)
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def encode(self, addresses) -> np.ndarray:
+        """
+        Gets ids for addresses, adding unseen ones
+        Params:
+            addresses: array-like of address strings
+        Returns:
+            int32 array of ids
+        """
+        addresses = np.asarray(addresses, dtype=object)
+        with self.lock:
+            codes = self.index.get_indexer(addresses)
+            unseen = codes < 0
+            if unseen.any():
+                self.index = self.index.append(pd.Index(pd.unique(addresses[unseen])))
+                codes[unseen] = self.index.get_indexer(addresses[unseen])
+        return codes.astype(np.int32)
+
+    def decode(self, ids) -> np.ndarray:
+        """
+        Gets addresses back from ids
+        Params:
+            ids: array-like of ids
+        Returns:
+            array of address strings
+        """
+        return self.index.values[np.asarray(ids)]
+
+    def encode_frame(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds from_id and to_id columns to a pyusd dataframe
+        Params:
+            dataframe: Dataframe containing pyusd data
+        Returns:
+            The same dataframe with id columns
+        """
+        dataframe['from_id'] = self.encode(dataframe['from_address'])
+        dataframe['to_id'] = self.encode(dataframe['to_address'])
+        return dataframe
+
+
+@st.cache_resource
+def get_address_book() -> AddressBook:
+    """
+    Address book shared by the loader and every metric
+    """
+    return AddressBook()
@@ -1,5 +1,4 @@
 import json
-from web3 import Web3
 import gspread
 import numpy as np
 from google.oauth2.service_account import Credentials
@@ -11,9 +10,14 @@ import streamlit_shadcn_ui as ui
 from get_kaggle_data import get_kaggle_df # tie to a condition or button
 from getmetrics import get_metrics
 from myhelpers import get_and_format
-from myhelpers import upload_sheets, append_sheets
-from myhelpers import make_line_plots, make_bar
-from timeforecast import prophet_forecast, plot_forecast
+from myhelpers import upload_sheets, sync_sheets
+from myhelpers import make_line_plots, make_bar, make_heatmap, make_pie
+from timeforecast import forecast_series, holt_winters_forecast, plot_forecast, FORECAST_FREQS, FORECAST_AGGS, FORECAST_MODELS
+from forecastjobs import get_forecast_service
+from datastore import read_dataset, dataset_fingerprint, store_stat, migrate_store
+from timeindex import TimeIndex
+from addressbook import get_address_book
+from ethprices import get_price_table
 
 ##  Set page config
 st.set_page_config(
@@ -42,12 +46,22 @@ ethersn_data = get_and_format()
 tkn_supply = ethersn_data[0]
 eth_price = ethersn_data[1]
 eth_price_timestamp = ethersn_data[2]
+# Historical eth prices, gas fees are priced at their own time
+prices = get_price_table()
+if eth_price is None:
+    # Gas fees need a price, without any the page cannot be built
+    if not len(prices):
+        st.error('Etherscan is unavailable, ETH price could not be loaded. Try again shortly.')
+        st.stop()
+    st.warning('Etherscan is unavailable, showing the last recorded ETH price')
+    eth_price, recorded_at = prices.last
+    eth_price_timestamp = recorded_at.strftime("%B %d, %Y %H:%M")
 
 # update data source
 update_data_cont = st.columns(8)
 with update_data_cont[0]:
     st.markdown(f'ETH:${eth_price:.2f} {eth_price_timestamp}',
-                help='Shows latest ETH Price applied to data')
+                help='Shows latest ETH Price, gas fees use the price at their own time')
 with update_data_cont[-1]:
     update_data = st.button(label='**Latest**', 
                             help='Gets the latest pyusd data',
@@ -56,18 +70,85 @@ with update_data_cont[-1]:
                             icon='🚨')
 
 # Load dataset
-def get_df() -> pd.DataFrame:
+@st.cache_resource
+def prepare_store():
     """
-    Loads the csv
+    Migrates an older store or converts the csv once per server, reads never write
     """
-    return pd.read_csv('dataset/pyusd.csv')
+    migrate_store()
 
-# if update data is clicked
-if update_data:
-    df = get_df()
-    st.toast('Updating to latest dataset')
-else:
-    df = get_df()
+@st.cache_resource(max_entries=4)
+def get_view(start_date, version: tuple) -> tuple:
+    """
+    Loads a dataset view with wallet ids once per store version
+    Params:
+        start_date: only load days on or after this date, the full history when None
+        version: store modification time and size, a new version is loaded again
+    Returns:
+        Tuple: dataframe sorted by block number and timestamp, its time index
+    """
+    df = get_address_book().encode_frame(read_dataset(start_date=start_date))
+    return df, TimeIndex(df)
+
+def upload_complete():
+    """
+    Uploads the full history to sheets, whatever the date filter
+    """
+    upload_sheets(get_view(None, store_stat())[0])
+
+def sync_complete():
+    """
+    Appends new rows of the full history to sheets, whatever the date filter
+    """
+    sync_sheets(get_view(None, store_stat())[0])
+
+# Seconds between polls of running forecast jobs
+FORECAST_POLL = 1.0
+
+def forecasts_pending(jobs: list) -> bool:
+    return any(job.status in ('queued', 'running') for _, job in jobs)
+
+def render_forecasts(jobs: list):
+    """
+    Renders forecast jobs, finished ones as plots and the others as their status
+    Params:
+        jobs: list of (title, forecast job)
+    """
+    for title, job in jobs:
+        fc_con = st.container(border=True)
+        status = job.status
+        if status == 'done':
+            model, forecast = job.result()
+            fig1, fig2 = plot_forecast(model, forecast, title)
+            fc_con.plotly_chart(fig1)
+            fc_con.plotly_chart(fig2)
+        elif status == 'failed':
+            fc_con.error(f'{title} forecast failed: {job.future.exception()}')
+        else:
+            fc_con.info(f'{title} forecast {status}, {job.elapsed:.0f}s')
+
+@st.fragment(run_every=FORECAST_POLL)
+def poll_forecasts(jobs: list):
+    """
+    Renders forecast jobs, Streamlit reruns only this fragment every FORECAST_POLL seconds
+    Params:
+        jobs: list of (title, forecast job)
+    """
+    render_forecasts(jobs)
+    # Once every job finished, a full rerun renders them without the timer
+    if not forecasts_pending(jobs):
+        st.rerun()
+
+def show_forecasts(jobs: list):
+    """
+    Renders forecast jobs, polling in a fragment while any is queued or running
+    Params:
+        jobs: list of (title, forecast job)
+    """
+    if forecasts_pending(jobs):
+        poll_forecasts(jobs)
+    else:
+        render_forecasts(jobs)
 
 ### Sidebar
 with st.sidebar:
@@ -82,23 +163,40 @@ with st.sidebar:
 
     # Forecast duration
     forecast_dur = int(st.text_input('Set duration of forecast', value='14'))
+    # Series the forecast is fitted on
+    forecast_freq = st.selectbox('Forecast interval', options=FORECAST_FREQS,
+                                 format_func={'D': 'Daily', 'h': 'Hourly'}.get,
+                                 help='Transactions are aggregated per interval before fitting')
+    forecast_agg = st.selectbox('Forecast aggregate', options=FORECAST_AGGS,
+                                help='Sum, mean or count of transactions per interval')
+    # Forecasting backend
+    forecast_model = st.selectbox('Forecast model', options=FORECAST_MODELS,
+                                  help='Holt-Winters is a quick trend and weekly season projection')
 
     ### Upload to sheets
     st.markdown('**Upload to Google Sheets**')
     upld_sheets = st.button('Upload Complete',
                                 help='Uploads complete data to sheets',
-                                on_click=upload_sheets,
-                                args=(df,))
-    # appnd_sheets = st.button('Append Existing',
-    #                          help='Appends most recent to sheets when new data is present',
-    #                          on_click=append_sheets,
-    #                          args=(df,))
+                                on_click=upload_complete)
+    appnd_sheets = st.button('Append Existing',
+                             help='Appends rows added since the last upload or sync',
+                             on_click=sync_complete)
     st.markdown("""
             [PYUSD SHEETS](https://docs.google.com/spreadsheets/d/1V84W8vQ1s0nzORT0RhopTT2VtqhvLUKmnUvpxMzN7Sw/edit?usp=sharing)""")
 
+# Only the day partitions on or after the filter date are read
+start_date = filter_date if confirm_date else None
+
+prepare_store()
+
+# if update data is clicked
+if update_data:
+    df, time_index = get_view(start_date, store_stat())
+    st.toast('Updating to latest dataset')
+else:
+    df, time_index = get_view(start_date, store_stat())
+
 if confirm_date:
-    df['date_filt'] = pd.to_datetime(df['timestamp']).dt.date
-    df = df[df['date_filt'] >= filter_date]
     # Earliest date
     earl_date = filter_date.strftime('%d %B')
 else:
@@ -106,16 +204,21 @@ else:
 
 
 # Lastest date
-lt_date = pd.to_datetime(df['timestamp'].tail(1).values).strftime('%d %B, %Y')[0]
+lt_date = time_index.last.strftime('%d %B, %Y')
 
-# Get metrics dict
-metrics = get_metrics(df)
+# Cheap cache key for the loaded view
+fingerprint = dataset_fingerprint(df, date_filter=start_date)
+# Gas fees in usd also depend on the eth prices of the view's times, live prices after them change nothing
+price_signature = prices.signature(time_index.last)
+
+# Get metrics, each group is computed on first access
+metrics = get_metrics(df, fingerprint, price_signature)
 
 ### PYUSD Dashboard
 metrics_cols = st.columns(5)
 with metrics_cols[0]:
     ui.metric_card(title="Total Supply",
-                   content=f"${tkn_supply}M",
+                   content=f"${tkn_supply}M" if tkn_supply is not None else 'N/A',
                    description="PYUSD Total Supply", key="card1")
 
 with metrics_cols[1]:
@@ -138,23 +241,13 @@ with metrics_cols[4]:
                    content=f"${metrics['total_revenue']}K",
                    description=f"{earl_date} to {lt_date}", key="card5")
 
-# Custom CSS to style tab buttons
-st.markdown("""
-    <style>
-        button[data-baseweb="tab"] {
-            font-size: 24px;
-            margin: 0;
-            width: 100%;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# Create tabs
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["### **Reach**", "### **Retention**", "### **Revenue**", "### **Swaps [dex]**", '### **Forecast**','### **Health Score**'])
+# Create tabs, only the selected tab's metrics are computed
+active_tab = ui.tabs(options=['Reach', 'Retention', 'Revenue', 'Swaps [dex]', 'Forecast', 'Health Score'],
+                     default_value='Reach', key='tabs')
 
 
 # Reach
-with tab1:
+if active_tab == 'Reach':
     # Top Senders
     # 3 Columns
     ts_cols = st.columns(3)
@@ -282,11 +375,11 @@ with tab1:
         ))
 
 # Retention
-with tab2:
+if active_tab == 'Retention':
     # Retention Table
     top_holders = metrics['top_holders']
     # Retention heatmap
-    rent_hmp = metrics['reten_fig']
+    rent_hmp = make_heatmap(metrics['retention_rate'], metrics['retention_unit'])
     # cols
     rent_col = st.columns(2)
     with rent_col[0]:
@@ -300,6 +393,16 @@ with tab2:
             y_axis_title='Balances (USD)',
             x_axis_title='Address'
         ), use_container_width=True)
+        # Largest balance changes on the latest day
+        bal_chg = st.container(border=True)
+        bal_chg.plotly_chart(make_bar(
+            df=metrics['balance_changes'],
+            x_col='address',
+            y_col='change_usd',
+            title=f'Largest balance changes ({lt_date})',
+            y_axis_title='Change (USD)',
+            x_axis_title='Address'
+        ), use_container_width=True)
         
     with rent_col[1]:
         # heatmap
@@ -307,7 +410,7 @@ with tab2:
         rent_col_hmp.plotly_chart(rent_hmp, use_container_width=True)
 
 # Revenue
-with tab3:
+if active_tab == 'Revenue':
     # cols
     tv_col = st.columns(3)
     rv_fee_col = st.columns(3)
@@ -424,10 +527,14 @@ with tab3:
             x_axis_title='Block Number',
             mode='v'
         ), use_container_width=True)
+    # Block gaps
+    block_gaps = metrics['block_gaps']
+    with st.expander(f'Block gaps ({len(block_gaps)})'):
+        st.dataframe(block_gaps, hide_index=True, use_container_width=True)
 
 
 # Swaps
-with tab4:
+if active_tab == 'Swaps [dex]':
     # cols
     swaps_col = st.columns(3)
     swaps_dex_col = st.columns(3)
@@ -436,7 +543,7 @@ with tab4:
     # Swap fig col
     with swap_fig_col[0]:
         swap_fig_con = st.container(border=True)
-        swap_fig_con.plotly_chart(metrics['dex_swaps_figs'],
+        swap_fig_con.plotly_chart(make_pie(metrics['dex_counts'], 'Dex Swaps'),
                                   use_container_width=True)
     # Swaps --daily, --weekly, --monthly
     with swaps_col[0]:
@@ -514,7 +621,7 @@ with tab4:
         ), use_container_width=True)
     
 # Forecast
-with tab5:
+if active_tab == 'Forecast':
     fore_cast_btn = st.columns(2)
     with fore_cast_btn[0]:
         # Forecast button
@@ -523,28 +630,46 @@ with tab5:
         # Forecast button
         fore_cast_gf = st.checkbox('Forecast (Gas Fee USD)')
 
-    fore_cast_cols = st.columns(1)
-    fore_cast_cols2 = st.columns(1)
-    with fore_cast_cols[0]:
-
-        if forecast_dur and fore_cast_amnt:
-            # Forecast values - Amount
-            amnt_model, amnt_forecast = prophet_forecast(df, column='amount', periods=forecast_dur)
-            amnt_fig1, amnt_fig2 = plot_forecast(amnt_model, amnt_forecast, 'Amount (PYUSD)')
-            fc_amnt_con = st.container(border=True)
-            fc_amnt_con.plotly_chart(amnt_fig1)
-            fc_amnt_con.plotly_chart(amnt_fig2)
-    with fore_cast_cols2[0]:
-        if fore_cast_gf and forecast_dur: 
-            # Forecast values - gas fee usd
-            gf_model, gf_forecast = prophet_forecast(df, column='gas_fees_usd', periods=forecast_dur)
-            gf_fig1, gf_fig2 = plot_forecast(amnt_model, amnt_forecast, 'Gas Fees')
-            fc_gf_con = st.container(border=True)
-            fc_gf_con.plotly_chart(gf_fig1 )
-            fc_gf_con.plotly_chart(gf_fig2)
+    # Series to forecast: title, column, fingerprint of its data, and of the eth prices for gas fees
+    fc_series = []
+    if fore_cast_amnt:
+        fc_series.append(('Amount (PYUSD)', 'amount', fingerprint))
+    if fore_cast_gf:
+        fc_series.append(('Gas Fees', 'gas_fees_usd', f'{fingerprint}-{price_signature}'))
+    forecast_jobs = []
+    if forecast_dur and fc_series:
+        # Series aggregated once per data fingerprint, only they reach the models
+        fc_series = [(title, column, fc_fingerprint,
+                      forecast_series(df, fc_fingerprint, column, forecast_freq, forecast_agg))
+                     for title, column, fc_fingerprint in fc_series]
+        # Both models need at least two periods, e.g. a one day view with a daily interval has one
+        for title, _, _, series in fc_series:
+            if len(series) < 2:
+                st.warning(f'{title}: not enough data to forecast, pick an earlier date or an hourly interval')
+        fc_series = [item for item in fc_series if len(item[3]) >= 2]
+        if forecast_model == 'Holt-Winters':
+            # Fits in milliseconds, no need for the pool
+            for title, column, fc_fingerprint, series in fc_series:
+                try:
+                    hw_model, hw_forecast = holt_winters_forecast(series, fc_fingerprint, column, forecast_dur,
+                                                                  forecast_freq, forecast_agg)
+                except ValueError as e:
+                    st.warning(f'{title} forecast failed: {e}')
+                    continue
+                hw_fig1, hw_fig2 = plot_forecast(hw_model, hw_forecast, title)
+                fc_hw_con = st.container(border=True)
+                fc_hw_con.plotly_chart(hw_fig1)
+                fc_hw_con.plotly_chart(hw_fig2)
+        else:
+            # Fits run in the background, jobs for the same series are shared across sessions
+            forecast_service = get_forecast_service()
+            for title, column, fc_fingerprint, series in fc_series:
+                forecast_jobs.append((title, forecast_service.submit(
+                    series, fc_fingerprint, column, forecast_dur, forecast_freq, forecast_agg)))
+    show_forecasts(forecast_jobs)
  
 # Health score
-with tab6:
+if active_tab == 'Health Score':
     # Health score label column and container
     health_score_col = st.columns(1)
     health_score_con = st.container(border=True)
@@ -558,4 +683,23 @@ with tab6:
             y_axis_title='Count',
             mode='v'
         ))
+    # Health score bands over time
+    health_trend_cols = st.columns(2)
+    health_colors = ['#ff6347', '#10EEEE', '#14c3c3', '#f4c20d', '#CE3104']
+    for col, key, title in [(health_trend_cols[0], 'transaction_health_score_daily', 'Daily Health Score Bands'),
+                            (health_trend_cols[1], 'transaction_health_score_wkly', 'Weekly Health Score Bands')]:
+        bands = metrics[key]
+        with col:
+            health_trend_con = st.container(border=True)
+            health_trend_con.plotly_chart(make_line_plots(
+                df=bands,
+                y_col='',
+                title=title,
+                y_axis_title='',
+                multi_vars=[c for c in bands.columns if c != 'timestamp'],
+                var_name='Health Label',
+                value_name='Count',
+                multicols=True,
+                colors=health_colors
+            ), use_container_width=True)
 
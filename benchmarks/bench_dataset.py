@@ -0,0 +1,85 @@
+"""
+Compares cold load time and peak RSS of the csv and parquet dataset paths,
+and of a recent-week view read with the date filter pushed down
+
+Usage:
+    python benchmarks/bench_dataset.py --rows 10000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datastore import store_stat, current_version
+
+
+def load(kind: str, path: str, start_date: str = None):
+    """
+    Loads the dataset once and prints load time and peak RSS as json
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    if kind == 'csv':
+        df = pd.read_csv(path)
+    else:
+        from datastore import read_dataset
+        df = read_dataset(path, start_date=start_date)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'kind': kind, 'rows': len(df), 'seconds': round(seconds, 3), 'peak_rss_mb': round(peak_mb, 1)}))
+
+
+def generate(rows: int, directory: str):
+    """
+    Writes a synthetic dataset as csv and parquet
+    """
+    from synthetic import make_transfers
+    from datastore import write_dataset
+
+    df = make_transfers(rows)
+    df.to_csv(os.path.join(directory, 'pyusd.csv'), index=False)
+    write_dataset(df, os.path.join(directory, 'pyusd.parquet'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--load', nargs='+', metavar='ARG', help=argparse.SUPPRESS)
+    parser.add_argument('--generate', metavar='DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load(*args.load)
+        return
+    if args.generate:
+        generate(args.rows, args.generate)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'pyusd.csv')
+        parquet_path = os.path.join(tmp, 'pyusd.parquet')
+        # Generate in a child too, forked children inherit the parent's peak RSS
+        subprocess.run([sys.executable, __file__, '--rows', str(args.rows), '--generate', tmp], check=True)
+        print(f'csv: {os.path.getsize(csv_path) / 2**20:.1f} MB, parquet: {store_stat(parquet_path)[1] / 2**20:.1f} MB')
+
+        # Last 7 days of the store
+        days = sorted(name.split('=')[1] for name in os.listdir(current_version(parquet_path)))
+        week_start = days[-7]
+
+        # Each load runs in a fresh process so timings and RSS are cold
+        for load_args in [('csv', csv_path), ('parquet', parquet_path), ('parquet-week', parquet_path, week_start)]:
+            out = subprocess.run([sys.executable, __file__, '--load', *load_args],
+                                 capture_output=True, text=True, check=True)
+            print(out.stdout.strip())
+
+
+if __name__ == '__main__':
+    main()
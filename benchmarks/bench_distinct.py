@@ -0,0 +1,86 @@
+"""
+Measures exact vs HyperLogLog distinct wallet counts per day, week and
+month: fold time, state kept between folds, peak traced memory and the
+relative error of the sketches
+
+Usage:
+    python benchmarks/bench_distinct.py --rows 5000000 --wallets 2000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from hyperloglog import PeriodSketches, precision_for_error
+from metricsengine import PeriodDistinct
+from rollups import period_labels
+
+
+def exact_counts(timestamps: pd.Series, wallets: pd.Series, chunks: int) -> dict:
+    """
+    Folds with one exact distinct counter per frequency
+    """
+    distinct = {freq: PeriodDistinct(freq) for freq in ('D', 'W', 'ME')}
+    for part in np.array_split(np.arange(len(wallets)), chunks):
+        for freq, counter in distinct.items():
+            counter.fold(period_labels(timestamps.iloc[part], freq), wallets.iloc[part])
+    return distinct, {freq: counter.result() for freq, counter in distinct.items()}
+
+
+def approx_counts(timestamps: pd.Series, wallets: pd.Series, chunks: int, error: float) -> dict:
+    """
+    Folds into daily sketches, weeks and months are merged from days
+    """
+    sketches = PeriodSketches('D', precision_for_error(error))
+    for part in np.array_split(np.arange(len(wallets)), chunks):
+        sketches.fold(period_labels(timestamps.iloc[part], 'D'), wallets.iloc[part])
+    return sketches, {freq: sketches.result(freq) for freq in ('D', 'W', 'ME')}
+
+
+def measured(fn, *args) -> tuple:
+    """
+    Runs fn, returning its counts, seconds taken, MB held by its state and peak traced MB
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    state, counts = fn(*args)
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return counts, elapsed, held / 2**20, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--wallets', type=int, default=2_000_000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--chunks', type=int, default=10)
+    parser.add_argument('--error', type=float, default=0.01)
+    args = parser.parse_args()
+
+    # Wallet activity in time order, one row per sender or receiver
+    rng = np.random.default_rng(0)
+    seconds = np.sort(rng.integers(0, args.days * 86400, args.rows))
+    timestamps = pd.Series(pd.Timestamp('2025-03-17') + pd.to_timedelta(seconds, unit='s'))
+    wallets = pd.Series(rng.integers(0, args.wallets, args.rows).astype(np.int32))
+
+    exact, exact_time, exact_held, exact_peak = measured(exact_counts, timestamps, wallets, args.chunks)
+    approx, approx_time, approx_held, approx_peak = measured(approx_counts, timestamps, wallets,
+                                                             args.chunks, args.error)
+
+    print(f'rows: {args.rows}, wallets: {args.wallets}, days: {args.days}, error bound: {args.error}')
+    print(f'exact:  {exact_time:.2f} s, state {exact_held:.1f} MB, peak {exact_peak:.1f} MB')
+    print(f'approx: {approx_time:.2f} s, state {approx_held:.1f} MB, peak {approx_peak:.1f} MB')
+    for freq in ('D', 'W', 'ME'):
+        errors = (approx[freq] / exact[freq] - 1).abs()
+        print(f'{freq:>2} relative error: mean {errors.mean():.4f}, max {errors.max():.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures building the dashboard charts on a first run and on a rerun
+served from the figure cache, and checks every rerun chart was a cache hit
+
+Usage:
+    python benchmarks/bench_figures.py --rows 1000000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING)
+
+import plotly.io as pio
+from synthetic import make_transfers
+
+
+def charts(metrics: dict, make_line_plots, make_bar, make_heatmap, make_pie) -> list:
+    """
+    Builds a sample of the app's charts, serialized as st.plotly_chart does
+    """
+    figures = [
+        make_line_plots(df=metrics[key], y_col='total_volume', title=title, multi_vars=[], var_name='',
+                        value_name='', y_axis_title='Volume')
+        for key, title in (('daily_swaps', 'Daily swaps'), ('wkly_swaps', 'Weekly swaps'),
+                           ('monthly_swaps', 'Monthly swaps'))
+    ]
+    figures += [
+        make_line_plots(df=metrics['hr_avg_fee'], y_col='gas_fees_usd', title='Average fee per hour',
+                        multi_vars=[], var_name='', value_name='', y_axis_title='Fees (USD)'),
+        make_bar(df=metrics['top_holders'], x_col='address', y_col='balance_usd', title='Top holders',
+                 y_axis_title='Balances (USD)', x_axis_title='Address'),
+        make_heatmap(metrics['retention_rate'], metrics['retention_unit']),
+        make_pie(metrics['dex_counts'], 'Dex Swaps'),
+    ]
+    return [pio.to_json(figure, validate=False) for figure in figures]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # myhelpers reads the etherscan key when imported, a placeholder is enough here
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, '.streamlit'))
+        with open(os.path.join(tmp, '.streamlit', 'secrets.toml'), 'w') as f:
+            f.write('[etherscan_key]\napi_key = "unused"\n')
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            from myhelpers import make_line_plots, make_bar, make_heatmap, make_pie
+        finally:
+            os.chdir(cwd)
+    from ethprices import PriceTable
+    from figcache import get_figure_cache
+    from metricsengine import MetricsEngine
+
+    metrics = MetricsEngine(PriceTable.fixed(1800.0)).metrics(make_transfers(args.rows))
+    cache = get_figure_cache()
+    runs = []
+    for run in ('first run', 'rerun'):
+        before = cache.stats()
+        start = time.perf_counter()
+        specs = charts(metrics, make_line_plots, make_bar, make_heatmap, make_pie)
+        elapsed = (time.perf_counter() - start) * 1000
+        after = cache.stats()
+        hits, misses = after['hits'] - before['hits'], after['misses'] - before['misses']
+        print(f'{run}: {len(specs)} charts in {elapsed:.1f} ms, {hits} hits, {misses} misses')
+        runs.append([json.loads(spec) for spec in specs])
+    # Nothing changed between the runs, every chart must come from the cache unchanged
+    assert misses == 0 and hits == len(specs), 'rerun rebuilt figures'
+    assert runs[0] == runs[1], 'cached figures differ from the built ones'
+
+
+if __name__ == '__main__':
+    main()
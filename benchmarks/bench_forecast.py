@@ -0,0 +1,100 @@
+"""
+Backtests Holt-Winters against Prophet on the daily pyusd amount series,
+reporting fit time and forecast error over rolling cutoffs
+
+Usage:
+    python benchmarks/bench_forecast.py --horizon 14 --folds 6
+    python benchmarks/bench_forecast.py --rows 2000000  # synthetic data when there is no dataset
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def daily_series(args) -> pd.DataFrame:
+    """
+    Daily amount series of the dataset, or of synthetic transfers when there is no dataset
+    """
+    if os.path.exists(args.dataset):
+        from datastore import read_dataset
+        df = read_dataset(args.dataset, columns=['timestamp', 'amount'])
+    else:
+        from synthetic import make_transfers
+        print(f'no dataset at {args.dataset}, using {args.rows} synthetic transfers')
+        df = make_transfers(args.rows)
+    series = df.groupby(pd.to_datetime(df['timestamp']).dt.floor('D'))['amount'].sum()
+    series = series.asfreq('D', fill_value=0.0)
+    return pd.DataFrame({'ds': series.index, 'y': series.values.astype('float64')})
+
+
+def fit_holt_winters(train: pd.DataFrame, horizon: int) -> np.ndarray:
+    from fastforecast import HoltWinters
+    return HoltWinters('D').fit(train).predict(horizon)['yhat'].to_numpy()[-horizon:]
+
+
+def fit_prophet(train: pd.DataFrame, horizon: int) -> np.ndarray:
+    from prophet import Prophet
+    model = Prophet(weekly_seasonality=True, daily_seasonality=False)
+    model.fit(train)
+    future = model.make_future_dataframe(periods=horizon, freq='D')
+    return model.predict(future)['yhat'].to_numpy()[-horizon:]
+
+
+def backtest(series: pd.DataFrame, fit, horizon: int, folds: int) -> dict:
+    """
+    Fits on every cutoff and scores the next horizon days
+    Params:
+        series: daily ds, y series
+        fit: function of (train, horizon) returning the forecast values
+        horizon: days forecast after each cutoff
+        folds: number of cutoffs, horizon days apart, ending horizon days before the last day
+    Returns:
+        Dict: median fit seconds, mean absolute error, mean absolute percentage error
+    """
+    seconds, errors, actuals = [], [], []
+    for fold in range(folds, 0, -1):
+        cutoff = len(series) - fold * horizon
+        train, test = series.iloc[:cutoff], series['y'].to_numpy()[cutoff:cutoff + horizon]
+        start = time.perf_counter()
+        forecast = fit(train, horizon)
+        seconds.append(time.perf_counter() - start)
+        errors.append(np.abs(forecast[:len(test)] - test))
+        actuals.append(np.abs(test))
+    errors, actuals = np.concatenate(errors), np.concatenate(actuals)
+    return {'fit_s': float(np.median(seconds)), 'mae': float(errors.mean()),
+            'mape': float((errors / np.where(actuals > 0, actuals, np.nan)).mean(where=actuals > 0))}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='dataset/pyusd.parquet')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--horizon', type=int, default=14)
+    parser.add_argument('--folds', type=int, default=6)
+    args = parser.parse_args()
+
+    series = daily_series(args)
+    folds = min(args.folds, (len(series) - 2 * 7) // args.horizon)
+    print(f'{len(series)} days, {folds} folds of {args.horizon} days')
+
+    backends = [('holt-winters', 'fastforecast', fit_holt_winters), ('prophet', 'prophet', fit_prophet)]
+    for name, module, fit in backends:
+        start = time.perf_counter()
+        try:
+            __import__(module)
+        except ImportError:
+            print(f'{name}: not installed, skipped')
+            continue
+        import_s = time.perf_counter() - start
+        scores = backtest(series, fit, args.horizon, folds)
+        print(f'{name}: import {import_s:.2f} s, fit {scores["fit_s"] * 1000:.1f} ms, '
+              f'MAE {scores["mae"]:,.0f}, MAPE {scores["mape"]:.1%}')
+
+
+if __name__ == '__main__':
+    main()
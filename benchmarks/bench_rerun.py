@@ -0,0 +1,75 @@
+"""
+Measures the cache lookup cost paid on every rerun by the cached metric
+and forecast functions, keyed on the dataframe contents vs a fingerprint
+
+Usage:
+    python benchmarks/bench_rerun.py --rows 1000000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING)
+
+import streamlit as st
+from datastore import write_dataset, read_dataset, dataset_fingerprint
+from synthetic import make_transfers
+
+
+@st.cache_data
+def by_frame(dataframe, name: str) -> dict:
+    return {'rows': len(dataframe)}
+
+
+@st.cache_data
+def by_fingerprint(_dataframe, fingerprint: str, name: str) -> dict:
+    return {'rows': len(_dataframe)}
+
+
+def timed(fn, repeat: int) -> float:
+    """
+    Best time in ms of repeat calls
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pyusd.parquet')
+        write_dataset(make_transfers(args.rows), path)
+        df = read_dataset(path)
+
+        # A rerun reads two metric groups, the kpis and the viewed tab
+        def frame_rerun():
+            by_frame(df, 'kpis')
+            by_frame(df, 'reach')
+
+        def fingerprint_rerun():
+            fingerprint = dataset_fingerprint(df, path)
+            by_fingerprint(df, fingerprint, 'kpis')
+            by_fingerprint(df, fingerprint, 'reach')
+
+        # Warm both caches
+        frame_rerun()
+        fingerprint_rerun()
+        print(f'rows: {args.rows}')
+        print(f'hashing dataframe: {timed(frame_rerun, args.repeat):.1f} ms per rerun')
+        print(f'fingerprint:       {timed(fingerprint_rerun, args.repeat):.1f} ms per rerun')
+
+
+if __name__ == '__main__':
+    main()
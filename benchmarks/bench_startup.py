@@ -0,0 +1,60 @@
+"""
+Measures a fresh process computing the revenue and swaps tabs with and
+without the materialized hourly rollup table
+
+Usage:
+    python benchmarks/bench_startup.py --rows 1000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def startup(directory: str, use_table: bool):
+    """
+    Loads the dataset and computes the rollup backed groups, printing the time taken
+    """
+    from datastore import read_dataset
+    from addressbook import AddressBook
+    from metricsengine import MetricsEngine
+    from ethprices import PriceTable
+
+    df = AddressBook().encode_frame(read_dataset(os.path.join(directory, 'pyusd.parquet')))
+    rollup_path = os.path.join(directory, 'hourly_rollup.parquet') if use_table else None
+    start = time.perf_counter()
+    engine = MetricsEngine(PriceTable.fixed(1800.0), rollup_path=rollup_path)
+    engine.group_metrics(df, 'swaps')
+    engine.group_metrics(df, 'rollups')
+    print(f'{"with" if use_table else "without"} table: {time.perf_counter() - start:.3f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--run', nargs=2, metavar=('DIR', 'USE_TABLE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        startup(args.run[0], args.run[1] == '1')
+        return
+
+    from datastore import write_dataset
+    from synthetic import make_transfers
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_dataset(make_transfers(args.rows), os.path.join(tmp, 'pyusd.parquet'))
+        runs = [('0', 'no table'), ('1', 'first start, builds the table'), ('1', 'restart, reads the table')]
+        for use_table, label in runs:
+            print(f'{label}: ', end='', flush=True)
+            subprocess.run([sys.executable, __file__, '--run', tmp, use_table], check=True)
+        size = os.path.getsize(os.path.join(tmp, 'hourly_rollup.parquet'))
+        print(f'table size: {size / 2**10:.1f} KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+# Dex routers used by the swap metrics
+DEX_ADDRESSES = ['0x4a4d2410c3d4cfa8dd0d275bedefbd2f7b61ba2e',
+                 '0x13394005c1012e708fce1eb974f1130fdc73a5ce',
+                 '0xf313d711d71eb9a607b4a61a827a9e32a7846621']
+
+
+def make_transfers(n_rows: int, n_wallets: int = 200_000, seed: int = 0,
+                   start: str = '2025-03-17') -> pd.DataFrame:
+    """
+    Builds a synthetic pyusd transfers dataframe for benchmarks
+    Params:
+        n_rows: number of transfers
+        n_wallets: number of distinct wallets
+        seed: random seed
+        start: first transfer date
+    Returns:
+        Dataframe with the dataset columns, sorted by block
+    """
+    rng = np.random.default_rng(seed)
+    # Wallet pool, with the dex routers mixed in
+    wallets = np.array([f'0x{w:040x}' for w in rng.integers(0, 2**63, n_wallets)] + DEX_ADDRESSES)
+    # ~ 4 transfers per block, one block every 12 seconds
+    blocks = 22_000_000 + np.sort(rng.integers(0, max(n_rows // 4, 1), n_rows))
+    timestamps = pd.Timestamp(start) + pd.to_timedelta((blocks - blocks[0]) * 12, unit='s')
+    return pd.DataFrame({
+        'tx_hash': [f'0x{h:064x}' for h in rng.integers(0, 2**63, n_rows)],
+        'block_number': blocks,
+        'timestamp': timestamps,
+        'from_address': wallets[rng.zipf(1.5, n_rows) % len(wallets)],
+        'to_address': wallets[rng.integers(0, len(wallets), n_rows)],
+        'amount': np.round(rng.lognormal(6, 2, n_rows), 6),
+        'gas_fees_eth': np.round(rng.lognormal(-9, 1, n_rows), 9),
+    })
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from ledger import top_n
+
+# Per block statistics: column -> (source column, reduction)
+BLOCK_STATS = {
+    'amount_sum': ('amount', np.add),
+    'amount_max': ('amount', np.maximum),
+    'gas_fees_usd_sum': ('gas_fees_usd', np.add),
+    'gas_fees_usd_max': ('gas_fees_usd', np.maximum),
+    'first_timestamp': ('timestamp', np.minimum),
+    'last_timestamp': ('timestamp', np.maximum),
+}
+
+
+class BlockIndex:
+    """
+    Per block statistics, sorted by block number.
+
+    Each fold groups its rows by block once and reduces every statistic
+    over the same group boundaries. Blocks never straddle two folds, so
+    new blocks are appended after the existing ones and the table stays
+    sorted, which turns block ranges into binary searches.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.table = None
+
+    def fold(self, chunk: pd.DataFrame):
+        """
+        Adds the blocks of a chunk
+        Params:
+            chunk: prepared transactions above the last folded block
+        """
+        if chunk.empty:
+            return
+        blocks = chunk['block_number'].to_numpy(dtype=np.int64)
+        order = None if np.all(blocks[:-1] <= blocks[1:]) else np.argsort(blocks, kind='stable')
+        columns = {column: chunk[column].to_numpy() for column in ('amount', 'gas_fees_usd')}
+        columns['timestamp'] = chunk['timestamp'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+        if order is not None:
+            blocks = blocks[order]
+            columns = {column: values[order] for column, values in columns.items()}
+
+        # Group boundaries
+        block_numbers, starts = np.unique(blocks, return_index=True)
+        part = {'block_number': block_numbers, 'tx_count': np.diff(np.append(starts, len(blocks)))}
+        for name, (column, reduce) in BLOCK_STATS.items():
+            part[name] = reduce.reduceat(columns[column], starts)
+        self.parts.append(part)
+        self.table = None
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The whole table, one row per block
+        """
+        if self.table is None:
+            names = ['block_number', 'tx_count'] + list(BLOCK_STATS)
+            table = pd.DataFrame({name: np.concatenate([part[name] for part in self.parts])
+                                  if self.parts else np.zeros(0) for name in names})
+            table['amount_mean'] = table['amount_sum'] / table['tx_count']
+            table['gas_fees_usd_mean'] = table['gas_fees_usd_sum'] / table['tx_count']
+            for column in ('first_timestamp', 'last_timestamp'):
+                table[column] = table[column].astype('int64').astype('datetime64[ns]')
+            self.table = table
+        return self.table
+
+    def between(self, start_block: int = None, end_block: int = None) -> pd.DataFrame:
+        """
+        Blocks in a range
+        Params:
+            start_block: first block included, from the beginning when None
+            end_block: last block included, to the end when None
+        Returns:
+            Slice of the table
+        """
+        table = self.frame()
+        blocks = table['block_number'].to_numpy()
+        start = 0 if start_block is None else np.searchsorted(blocks, start_block, side='left')
+        end = len(blocks) if end_block is None else np.searchsorted(blocks, end_block, side='right')
+        return table.iloc[start:end]
+
+    def top(self, column: str, n: int = 5, start_block: int = None, end_block: int = None) -> pd.DataFrame:
+        """
+        Blocks with the largest values of a statistic
+        Params:
+            column: statistic column, e.g. gas_fees_usd_mean
+            n: number of blocks
+            start_block: first block included, from the beginning when None
+            end_block: last block included, to the end when None
+        Returns:
+            Dataframe of block numbers and the statistic, largest first
+        """
+        table = self.between(start_block, end_block)
+        top_rows = top_n(table[column].to_numpy(), n)
+        return table[['block_number', column]].iloc[top_rows].reset_index(drop=True)
+
+    def gaps(self, min_blocks: int = 1) -> pd.DataFrame:
+        """
+        Runs of consecutive blocks without any transaction
+        Params:
+            min_blocks: shortest run reported
+        Returns:
+            Dataframe of the blocks around each gap, missing block count and seconds between them
+        """
+        table = self.frame()
+        blocks = table['block_number'].to_numpy()
+        missing = np.diff(blocks) - 1
+        at = np.flatnonzero(missing >= min_blocks)
+        return pd.DataFrame({
+            'after_block': blocks[at],
+            'before_block': blocks[at + 1],
+            'missing_blocks': missing[at],
+            'seconds': (table['first_timestamp'].to_numpy()[at + 1] -
+                        table['last_timestamp'].to_numpy()[at]) / np.timedelta64(1, 's'),
+        })
@@ -0,0 +1,464 @@
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from timeindex import sort_transactions
+try:
+    import fcntl
+except ImportError:
+    # Windows, writers are only serialized within one process
+    fcntl = None
+
+# Dataset locations, the parquet store is a directory with one partition per day.
+# Each write publishes a new immutable version next to PARQUET_PATH, and a
+# pointer file names the current one, see publish
+DATASET_DIR = 'dataset'
+CSV_PATH = os.path.join(DATASET_DIR, 'pyusd.csv')
+PARQUET_PATH = os.path.join(DATASET_DIR, 'pyusd.parquet')
+# Materialized hourly rollup of the dataset
+ROLLUP_PATH = os.path.join(DATASET_DIR, 'hourly_rollup.parquet')
+# Fitted forecast models
+FORECAST_DIR = os.path.join(DATASET_DIR, 'forecasts')
+# Progress of an interrupted google sheets upload
+SHEETS_PROGRESS_PATH = os.path.join(DATASET_DIR, 'sheets_upload.json')
+# Last dataset row synced to google sheets
+SHEETS_WATERMARK_PATH = os.path.join(DATASET_DIR, 'sheets_watermark.json')
+# Historical eth prices used for gas fees in usd
+ETH_PRICE_PATH = os.path.join(DATASET_DIR, 'eth_prices.parquet')
+# Last block ingested from the chain
+INGEST_CHECKPOINT_PATH = os.path.join(DATASET_DIR, 'ingest_checkpoint.json')
+
+# Explicit schema for the pyusd transfers dataset
+SCHEMA = pa.schema([
+    ('tx_hash', pa.string()),
+    ('block_number', pa.int64()),
+    ('timestamp', pa.timestamp('us')),
+    ('from_address', pa.string()),
+    ('to_address', pa.string()),
+    ('amount', pa.float64()),
+    ('gas_fees_eth', pa.float64()),
+])
+
+# Hive style day partitions: pyusd.parquet/date=2025-03-17/part-00000.parquet
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive')
+# Numbered files within a day partition, later refreshes add parts that sort after earlier ones
+PART_NAME = 'part-{:05d}.parquet'
+# Bytes of csv parsed per batch when streaming a refresh
+CSV_BLOCK_SIZE = 64 * 2**20
+# New rows held in memory before they are written to the store
+FLUSH_ROWS = 1_000_000
+# Row order of the store
+SORT_KEYS = [('block_number', 'ascending'), ('timestamp', 'ascending')]
+# Store version directories, pyusd.parquet.v00001, and the file naming the current one
+VERSION_NAME = '{}.v{:05d}'
+POINTER_NAME = '{}.current'
+# Versions kept besides the current one, for readers that resolved them before a publish
+KEEP_VERSIONS = 2
+# Lock file held by the store's writers, and the prefix of their temporary directories
+LOCK_NAME = '{}.lock'
+TMP_PREFIX = '{}.tmp'
+
+
+class WriterLock:
+    """
+    Exclusive lock of a store's writers, held from reading the current
+    version to publishing the next one. The price table locks its file the
+    same way.
+
+    A flock on the lock file serializes processes, a thread lock serializes
+    the sessions of one process. The lock is reentrant, so writers can call
+    each other, e.g. migrate_store converting the csv with append_csv.
+    """
+
+    def __init__(self, path: str):
+        self.lock_path = LOCK_NAME.format(path)
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        if self.depth == 0 and fcntl is not None:
+            try:
+                self.file = open(self.lock_path, 'a')
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+            except BaseException:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0 and self.file is not None:
+            # Closing the file releases the flock
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+# Writer locks of this process, one per store
+writer_locks = {}
+writer_locks_guard = threading.Lock()
+
+
+def writer_lock(path: str = PARQUET_PATH) -> WriterLock:
+    """
+    Writer lock of a store or file, shared by every writer of this process
+    """
+    with writer_locks_guard:
+        return writer_locks.setdefault(os.path.abspath(path), WriterLock(path))
+
+
+def make_tmp_dir(path: str) -> str:
+    """
+    Creates a temporary directory next to the store, private to one write
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory or '.', exist_ok=True)
+    return tempfile.mkdtemp(dir=directory or '.', prefix=TMP_PREFIX.format(name) + '-')
+
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Casts a pyusd dataframe to the dataset schema
+    Params:
+        df: Dataframe containing pyusd data
+    Returns:
+        Arrow table with the dataset schema
+    """
+    df = df[SCHEMA.names].copy()
+    # Timestamps are stored as naive UTC (prophet does not accept tz-aware ds)
+    timestamps = pd.to_datetime(df['timestamp'])
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+    df['timestamp'] = timestamps
+    return pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+
+
+def write_dataset(df: pd.DataFrame, path: str = PARQUET_PATH):
+    """
+    Writes dataframe to the parquet store, partitioned by day
+    Params:
+        df: Dataframe containing pyusd data
+        path: parquet store directory to write
+    """
+    table = to_table(sort_transactions(df))
+
+    # Write a new version next to the store and publish it, the store is never partially written
+    with writer_lock(path):
+        tmp_path = make_tmp_dir(path)
+        try:
+            write_days(table, tmp_path)
+            publish(tmp_path, path)
+        finally:
+            remove_path(tmp_path)
+
+
+def write_days(table: pa.Table, path: str):
+    """
+    Adds a table to a store directory as one new part per day
+    Params:
+        table: Arrow table with the dataset schema, sorted by block number and timestamp
+        path: store directory to add to
+    """
+    # Group rows by day, keeping their order within the day
+    days = pc.cast(table['timestamp'], pa.date32()).to_numpy()
+    order = np.argsort(days, kind='stable')
+    table = table.take(order)
+    labels, starts = np.unique(days[order], return_index=True)
+    lengths = np.diff(np.append(starts, len(order)))
+    for day, start, length in zip(labels, starts, lengths):
+        day_path = os.path.join(path, f'date={day}')
+        os.makedirs(day_path, exist_ok=True)
+        part = PART_NAME.format(len(os.listdir(day_path)))
+        pq.write_table(table.slice(start, length), os.path.join(day_path, part), compression='zstd')
+
+
+def store_versions(path: str) -> list:
+    """
+    Version directories of the store, oldest first
+    """
+    directory, name = os.path.split(path)
+    prefix = f'{name}.v'
+    numbers = sorted(int(entry[len(prefix):]) for entry in os.listdir(directory or '.')
+                     if entry.startswith(prefix) and entry[len(prefix):].isdigit())
+    return [VERSION_NAME.format(path, number) for number in numbers]
+
+
+def current_version(path: str = PARQUET_PATH):
+    """
+    Directory of the published store, read only, never renamed or written to
+    Params:
+        path: parquet store path
+    Returns:
+        Path of the current version, the unversioned store at path when nothing was published yet,
+        None when there is no store
+    """
+    try:
+        with open(POINTER_NAME.format(path)) as f:
+            return os.path.join(os.path.dirname(path), f.read().strip())
+    except FileNotFoundError:
+        # Stores written before versioning
+        return path if os.path.exists(path) else None
+
+
+def publish(tmp_path: str, path: str):
+    """
+    Publishes a store written to tmp_path as a new version, the caller holds the writer lock
+    Params:
+        tmp_path: complete store directory, renamed to the new version
+        path: parquet store path
+    """
+    versions = store_versions(path)
+    number = int(versions[-1].rsplit('.v', 1)[1]) + 1 if versions else 1
+    version = VERSION_NAME.format(path, number)
+    os.replace(tmp_path, version)
+    # Readers switch with one atomic rename of the pointer file
+    pointer = POINTER_NAME.format(path)
+    with open(f'{pointer}.tmp', 'w') as f:
+        f.write(os.path.basename(version))
+    os.replace(f'{pointer}.tmp', pointer)
+
+    # Retire old versions, the unversioned store counts as the oldest
+    retired = ([path] if os.path.exists(path) else []) + versions
+    for old in retired[:max(len(retired) - KEEP_VERSIONS, 0)]:
+        remove_path(old)
+
+
+def remove_path(path: str):
+    """
+    Removes a file or directory if it exists
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Hard links a file, copying it where links are not supported
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def migrate_store(path: str = PARQUET_PATH, csv_path: str = CSV_PATH):
+    """
+    Brings older stores to the versioned layout, run by writers before they write
+    Params:
+        path: parquet store path
+        csv_path: legacy csv dataset, converted when there is no store, None to skip
+    """
+    with writer_lock(path):
+        # Writes that never published, no writer is running while the lock is held
+        directory, name = os.path.split(path)
+        prefix = TMP_PREFIX.format(name)
+        for entry in os.listdir(directory or '.'):
+            if entry == prefix or entry.startswith(f'{prefix}-'):
+                remove_path(os.path.join(directory, entry))
+        # A swap of the unversioned store interrupted between its two renames
+        if not os.path.exists(path) and os.path.isdir(f'{path}.old'):
+            os.replace(f'{path}.old', path)
+        if os.path.exists(POINTER_NAME.format(path)):
+            return
+        if os.path.isfile(path):
+            # Single file store, rewritten as day partitions
+            write_dataset(pq.read_table(path).to_pandas(), path)
+        elif os.path.isdir(path):
+            # Unversioned store, linked into the first version
+            tmp_path = make_tmp_dir(path)
+            try:
+                shutil.copytree(path, tmp_path, copy_function=link_or_copy, dirs_exist_ok=True)
+                publish(tmp_path, path)
+            finally:
+                remove_path(tmp_path)
+        elif csv_path is not None and os.path.exists(csv_path):
+            append_csv(csv_path, path)
+
+
+def max_block(path: str = PARQUET_PATH):
+    """
+    Highest block in the store, None when the store is empty or missing
+    """
+    version = current_version(path)
+    days = sorted(name for name in os.listdir(version) if name.startswith('date=')) if version and os.path.isdir(version) else []
+    if not days:
+        return None
+    # Blocks follow time, the highest block is in the latest day
+    blocks = ds.dataset(os.path.join(version, days[-1]), format='parquet').to_table(columns=['block_number'])
+    return pc.max(blocks['block_number']).as_py()
+
+
+def parse_timestamps(values: pa.Array) -> pa.Array:
+    """
+    Parses timestamp strings, with or without a UTC offset, to naive UTC
+    """
+    try:
+        return pc.cast(pc.cast(values, pa.timestamp('us', 'UTC')), pa.timestamp('us'))
+    except pa.ArrowInvalid:
+        return pc.cast(values, pa.timestamp('us'))
+
+
+def csv_batches(csv_path: str, block_size: int = CSV_BLOCK_SIZE):
+    """
+    Streams a pyusd csv in batches of the dataset schema
+    Params:
+        csv_path: csv file to read
+        block_size: bytes parsed per batch
+    Returns:
+        Iterator of arrow tables
+    """
+    column_types = {field.name: field.type for field in SCHEMA}
+    column_types['timestamp'] = pa.string()
+    reader = pcsv.open_csv(csv_path, read_options=pcsv.ReadOptions(block_size=block_size),
+                           convert_options=pcsv.ConvertOptions(include_columns=SCHEMA.names,
+                                                               column_types=column_types))
+    for batch in reader:
+        table = pa.Table.from_batches([batch]).select(SCHEMA.names)
+        timestamps = parse_timestamps(table['timestamp'].combine_chunks())
+        yield table.set_column(SCHEMA.get_field_index('timestamp'), 'timestamp', timestamps)
+
+
+def append_batches(batches, path: str = PARQUET_PATH, flush_rows: int = FLUSH_ROWS) -> int:
+    """
+    Adds tables of new rows to a new version of the store
+    Params:
+        batches: iterable of arrow tables with the dataset schema
+        path: parquet store directory to add to
+        flush_rows: new rows held in memory before they are written
+    Returns:
+        Number of rows added
+    """
+    with writer_lock(path):
+        tmp_path = make_tmp_dir(path)
+        try:
+            # The new version links the partitions of the current one, no data is copied
+            version = current_version(path)
+            if version is not None:
+                shutil.copytree(version, tmp_path, copy_function=link_or_copy, dirs_exist_ok=True)
+
+            # Batches are written out every flush_rows
+            pending, pending_rows, added = [], 0, 0
+            for batch in batches:
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                if pending_rows >= flush_rows:
+                    write_days(pa.concat_tables(pending).sort_by(SORT_KEYS), tmp_path)
+                    added += pending_rows
+                    pending, pending_rows = [], 0
+            if pending_rows:
+                write_days(pa.concat_tables(pending).sort_by(SORT_KEYS), tmp_path)
+                added += pending_rows
+
+            # Readers see the current or the new version, never a partial one
+            if added:
+                publish(tmp_path, path)
+        finally:
+            remove_path(tmp_path)
+    return added
+
+
+def append_csv(csv_path: str, path: str = PARQUET_PATH, block_size: int = CSV_BLOCK_SIZE,
+               flush_rows: int = FLUSH_ROWS) -> int:
+    """
+    Streams the rows of a csv above the store's highest block into a new version of the store
+    Params:
+        csv_path: csv file with the full or latest pyusd data
+        path: parquet store directory to add to
+        block_size: bytes of csv parsed per batch
+        flush_rows: new rows held in memory before they are written
+    Returns:
+        Number of rows added
+    """
+    # The highest block is read under the same lock as the publish, a concurrent append cannot add the rows twice
+    with writer_lock(path):
+        migrate_store(path, csv_path=None)
+        last_block = max_block(path)
+        batches = csv_batches(csv_path, block_size)
+        # Only the new rows of each batch are kept
+        if last_block is not None:
+            batches = (batch.filter(pc.greater(batch['block_number'], last_block)) for batch in batches)
+        return append_batches(batches, path, flush_rows)
+
+
+def convert_csv(csv_path: str = CSV_PATH, path: str = PARQUET_PATH):
+    """
+    Converts the legacy csv dataset to the parquet store
+    Params:
+        csv_path: csv file to convert
+        path: parquet store directory to write
+    """
+    append_csv(csv_path, path)
+
+
+def read_dataset(path: str = PARQUET_PATH, columns: list = None, start_date=None) -> pd.DataFrame:
+    """
+    Reads the current version of the parquet store, never renaming or writing anything
+    Params:
+        path: parquet store path
+        columns: subset of columns to load, all when None
+        start_date: only read days on or after this date, all days when None
+    Returns:
+        Dataframe containing pyusd data, sorted by block number and timestamp
+    """
+    version = current_version(path)
+    if version is None:
+        raise FileNotFoundError(f'No parquet store at {path}, run migrate_store or a refresh first')
+    dataset = ds.dataset(version, format='parquet', partitioning=PARTITIONING)
+    # Day partitions before the start date are never opened
+    day_filter = None
+    if start_date is not None:
+        day_filter = ds.field('date') >= pa.scalar(pd.Timestamp(start_date).date(), pa.date32())
+    table = dataset.to_table(columns=columns or SCHEMA.names, filter=day_filter)
+    # Strings stay arrow-backed, self_destruct frees buffers as columns convert
+    dataframe = table.to_pandas(self_destruct=True, split_blocks=True,
+                                types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+    # Stores written before rows were sorted
+    if 'block_number' in dataframe and 'timestamp' in dataframe:
+        dataframe = sort_transactions(dataframe)
+    return dataframe
+
+
+def store_stat(path: str = PARQUET_PATH) -> tuple:
+    """
+    Latest modification time and total size of the files in the current version of the store
+    """
+    mtime, size = 0, 0
+    version = current_version(path)
+    for root, _, files in os.walk(version or path):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            mtime, size = max(mtime, stat.st_mtime_ns), size + stat.st_size
+    return mtime, size
+
+
+def dataset_fingerprint(dataframe: pd.DataFrame, path: str = PARQUET_PATH, date_filter=None) -> str:
+    """
+    Cheap identity of a loaded dataset view, used as cache key instead of hashing rows
+    Params:
+        dataframe: Dataframe loaded from path, after any filtering
+        path: parquet store the dataframe was read from
+        date_filter: active date filter, None when showing the full history
+    Returns:
+        Fingerprint string
+    """
+    mtime, size = store_stat(path)
+    # Rows are sorted, the last row holds the highest block
+    max_block = int(dataframe['block_number'].iat[-1]) if len(dataframe) else None
+    return f'{os.path.abspath(current_version(path) or path)}:{mtime}:{size}:{len(dataframe)}:{max_block}:{date_filter}'
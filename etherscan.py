@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+import aiohttp
+
+ETHERSCAN_URL = "https://api.etherscan.io/v2/api"
+# Seconds a single request may take
+REQUEST_DEADLINE = 5.0
+# Consecutive transport failures that open the circuit, and seconds it stays open
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30.0
+
+
+class EtherscanError(Exception):
+    """
+    Etherscan answered with status 0
+    """
+
+
+class EtherscanUnavailable(EtherscanError):
+    """
+    Etherscan could not be reached in time, or the circuit is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated failures.
+
+    Closed, requests go through and consecutive failures are counted. After
+    failure_threshold failures the circuit opens and requests fail without
+    being sent. Once reset_timeout has passed a single trial is let through,
+    closing the circuit if it succeeds and reopening it if not.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.clock() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent now
+        """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, success: bool):
+        """
+        Records the outcome of a request that was sent
+        """
+        with self.lock:
+            self.trial = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class EtherscanClient:
+    """
+    Asyncio Etherscan client with a pooled session, deadlines, a circuit breaker and a TTL cache.
+
+    Requests run on an event loop in a daemon thread and share one aiohttp
+    session, so several values are fetched concurrently for the latency of
+    one request. Fresh values are served from memory. Once a value is older
+    than the ttl the stale value is still served while it is refreshed in
+    the background, and if the refresh fails the last known value is kept.
+    """
+
+    def __init__(self, api_key: str, base_url: str = ETHERSCAN_URL, ttl: float = 60,
+                 deadline: float = REQUEST_DEADLINE, breaker: CircuitBreaker = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.ttl = ttl
+        self.deadline = deadline
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.cache = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.session = None
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the client's event loop and waits for its result
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def request(self, params: dict):
+        """
+        Calls the api within the deadline, recording the outcome with the circuit breaker
+        Params:
+            params: query parameters without the api key
+        Returns:
+            The result field of the response
+        """
+        if self.session is None:
+            # Created on the client's loop, shared by every request
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=10))
+        params = {**params, "apikey": self.api_key, "chainid": 1}
+        try:
+            data = await asyncio.wait_for(self.get(params), self.deadline)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.breaker.record(False)
+            raise EtherscanUnavailable(f'{params["action"]}: {type(e).__name__} {e}') from e
+        self.breaker.record(True)
+        if data["status"] != "1":
+            raise EtherscanError(data['message'])
+        return data["result"]
+
+    async def get(self, params: dict) -> dict:
+        async with self.session.get(self.base_url, params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def fetch_many(self, requests: dict) -> dict:
+        """
+        Fetches several values concurrently
+        Params:
+            requests: cache key -> (query parameters, function parsing the result)
+        Returns:
+            Dict: cache key -> value, or the exception the fetch raised
+        """
+        async def fetch(params, parse):
+            return parse(await self.request(params))
+        keys = list(requests)
+        # The breaker gates the fan out as a whole, a half-open trial is one round trip
+        if not self.breaker.allow():
+            return {key: EtherscanUnavailable('circuit open, etherscan failed repeatedly') for key in keys}
+        results = await asyncio.gather(*(fetch(*requests[key]) for key in keys), return_exceptions=True)
+        return dict(zip(keys, results))
+
+    def refresh(self, requests: dict) -> dict:
+        """
+        Fetches values and stores the ones that succeeded
+        """
+        results = self.run(self.fetch_many(requests))
+        fetched_at = time.monotonic()
+        for key, value in results.items():
+            if not isinstance(value, Exception):
+                self.cache[key] = (value, fetched_at)
+        return results
+
+    def refresh_in_background(self, requests: dict):
+        """
+        Refreshes values in a daemon thread, at most one refresh per key
+        """
+        with self.lock:
+            requests = {key: request for key, request in requests.items() if key not in self.refreshing}
+            self.refreshing.update(requests)
+        if not requests:
+            return
+
+        def run():
+            try:
+                for key, value in self.refresh(requests).items():
+                    if isinstance(value, Exception):
+                        print(f"Refresh of {key[0]} failed, serving last known value: {value}")
+            finally:
+                with self.lock:
+                    self.refreshing.difference_update(requests)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def cached(self, requests: dict) -> dict:
+        """
+        Gets values from the cache, fetching missing ones together and refreshing stale ones
+        Params:
+            requests: cache key -> (query parameters, function parsing the result)
+        Returns:
+            Dict: cache key -> value, or the exception that prevented a first fetch
+        """
+        values, missing, stale = {}, {}, {}
+        now = time.monotonic()
+        for key, request in requests.items():
+            entry = self.cache.get(key)
+            if entry is None:
+                missing[key] = request
+                continue
+            values[key] = entry[0]
+            if now - entry[1] >= self.ttl:
+                stale[key] = request
+        if stale:
+            self.refresh_in_background(stale)
+        # Nothing to serve yet, block on one concurrent fetch
+        if missing:
+            values.update(self.refresh(missing))
+        return values
+
+    def token_supply_request(self, contract_address: str) -> tuple:
+        return ('tokensupply', contract_address), ({
+            "module": "stats",
+            "action": "tokensupply",
+            "contractaddress": contract_address,
+        }, str)
+
+    def eth_price_request(self) -> tuple:
+        return ('ethprice',), ({"module": "stats", "action": "ethprice"},
+                               lambda eth_data: (eth_data['ethusd'], eth_data['ethusd_timestamp']))
+
+    def value(self, key: tuple, request: tuple):
+        """
+        Gets one value, raising the error of a failed first fetch
+        """
+        value = self.cached({key: request})[key]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def token_supply(self, contract_address: str) -> str:
+        """
+        Gets contract address token supply
+        Params:
+            contract_address: the contract address of the token
+        Returns:
+            Token supply string
+        """
+        return self.value(*self.token_supply_request(contract_address))
+
+    def eth_price(self) -> tuple:
+        """
+        Gets eth latest price and date
+        Returns:
+            Tuple: eth_price, eth_timestamp
+        """
+        return self.value(*self.eth_price_request())
+
+    def header(self, contract_address: str) -> tuple:
+        """
+        Gets token supply and eth price with concurrent requests
+        Params:
+            contract_address: the contract address of the token
+        Returns:
+            Tuple: token supply string or the error fetching it, (eth_price, eth_timestamp) or the error
+        """
+        supply_key, supply_request = self.token_supply_request(contract_address)
+        price_key, price_request = self.eth_price_request()
+        values = self.cached({supply_key: supply_request, price_key: price_request})
+        return values[supply_key], values[price_key]
@@ -0,0 +1,268 @@
+import argparse
+import contextlib
+import hashlib
+import os
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+from datastore import ETH_PRICE_PATH, writer_lock
+
+# Prices closer together than this are not recorded
+MIN_INTERVAL = pd.Timedelta(minutes=5)
+
+
+def empty_prices() -> pd.DataFrame:
+    return pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'), 'eth_usd': pd.Series(dtype='float64')})
+
+
+def file_stamp(path: str):
+    """
+    Identifies one save of a file, None when there is no file
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # Saves replace the file, a new inode even when mtime and size match
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class PriceTable:
+    """
+    ETH/USD prices sorted by time.
+
+    Each transaction is priced with the latest price at or before its
+    timestamp, so recording a later live price never changes the usd value
+    of older rows. Imported history is merged in by timestamp, and the
+    table is saved to a parquet file after each change.
+
+    Several processes share the file, e.g. the app recording live prices
+    and the import cli. Changes are made under a lock on the file to the
+    latest saved table, and refresh picks up what other processes saved.
+    """
+
+    def __init__(self, path: str = None, prices: pd.DataFrame = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.prices = prices if prices is not None else empty_prices()
+        # Save of the file the prices were last read from or written to
+        self.stamp = None
+
+    @classmethod
+    def load(cls, path: str = ETH_PRICE_PATH) -> 'PriceTable':
+        """
+        Reads the table saved at path, an empty table when there is no file
+        """
+        table = cls(path)
+        table.refresh()
+        return table
+
+    @classmethod
+    def fixed(cls, eth_usd: float) -> 'PriceTable':
+        """
+        Table pricing every transaction at one price, not saved
+        """
+        return cls(None, pd.DataFrame({'timestamp': pd.to_datetime([0]), 'eth_usd': [float(eth_usd)]}))
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @property
+    def last(self) -> tuple:
+        """
+        Latest price and its time, None when the table is empty
+        """
+        if self.prices.empty:
+            return None
+        row = self.prices.iloc[-1]
+        return float(row['eth_usd']), row['timestamp']
+
+    def append(self, timestamps, eth_usd) -> int:
+        """
+        Merges prices into the table by timestamp, a new price replaces the stored one at the same time
+        Params:
+            timestamps: naive UTC times of the prices
+            eth_usd: eth price in usd at each time
+        Returns:
+            Number of prices added or changed
+        """
+        new = pd.DataFrame({'timestamp': pd.to_datetime(timestamps).astype('datetime64[ns]'),
+                            'eth_usd': np.asarray(eth_usd, dtype='float64')})
+        new = new.dropna().drop_duplicates('timestamp', keep='last')
+        with self.lock, self.file_lock():
+            self.reload()
+            return self.merge(new)
+
+    def file_lock(self):
+        """
+        Lock of every process and table saving to the same file, held around reload, change and save
+        """
+        return writer_lock(self.path) if self.path is not None else contextlib.nullcontext()
+
+    def refresh(self) -> bool:
+        """
+        Re-reads the file if another process or table saved it since this table read or wrote it
+        Returns:
+            True if the prices were re-read
+        """
+        with self.lock:
+            return self.reload()
+
+    def reload(self) -> bool:
+        """
+        Same as refresh, the caller holds the lock
+        """
+        if self.path is None:
+            return False
+        stamp = file_stamp(self.path)
+        if stamp is None or stamp == self.stamp:
+            return False
+        prices = pd.read_parquet(self.path)
+        prices['timestamp'] = prices['timestamp'].astype('datetime64[ns]')
+        self.prices, self.stamp = prices, stamp
+        return True
+
+    def merge(self, new: pd.DataFrame) -> int:
+        """
+        Merges timestamp and eth_usd rows and saves the table, the caller holds both locks and reloaded the table
+        """
+        # Prices already stored with the same value change nothing
+        stored = self.prices.set_index('timestamp')['eth_usd']
+        unchanged = new['eth_usd'].to_numpy() == stored.reindex(new['timestamp']).to_numpy()
+        new = new[~unchanged]
+        if new.empty:
+            return 0
+        prices = pd.concat([self.prices, new], ignore_index=True)
+        self.prices = prices.drop_duplicates('timestamp', keep='last').sort_values('timestamp', ignore_index=True)
+        self.save()
+        return len(new)
+
+    def record(self, eth_usd: float, timestamp) -> bool:
+        """
+        Adds the current price, only later than every stored price and at most one every MIN_INTERVAL
+        Params:
+            eth_usd: eth price in usd
+            timestamp: time of the price, unix seconds or a datetime
+        Returns:
+            True if the price was added
+        """
+        if isinstance(timestamp, (int, float, np.integer)):
+            timestamp = pd.to_datetime(timestamp, unit='s')
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        new = pd.DataFrame({'timestamp': pd.Series([timestamp], dtype='datetime64[ns]'),
+                            'eth_usd': [float(eth_usd)]})
+        with self.lock, self.file_lock():
+            # Checked under the locks against the saved table, a live price never lands before a stored one
+            self.reload()
+            last = self.last
+            if last is not None and timestamp < last[1] + MIN_INTERVAL:
+                return False
+            return self.merge(new) > 0
+
+    def import_csv(self, csv_path: str) -> int:
+        """
+        Merges historical prices from a csv with timestamp and eth_usd columns
+        Params:
+            csv_path: csv file, prices at times already stored replace them
+        Returns:
+            Number of prices imported, added or changed
+        """
+        prices = pd.read_csv(csv_path, usecols=['timestamp', 'eth_usd'])
+        timestamps = pd.to_datetime(prices['timestamp'], utc=True).dt.tz_localize(None)
+        return self.append(timestamps, prices['eth_usd'])
+
+    def save(self):
+        """
+        Writes the table next to the target and renames it
+        """
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        self.prices.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        self.stamp = file_stamp(self.path)
+
+    def signature(self, until) -> str:
+        """
+        Hash of the prices used for times at or before until
+        Params:
+            until: latest time priced
+        Returns:
+            Hex digest, changes when any of those prices is added or replaced
+        """
+        prices = self.prices
+        # Earlier times use the first price even when it is later than until
+        count = max(int(prices['timestamp'].searchsorted(pd.Timestamp(until), side='right')), 1)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(pd.util.hash_pandas_object(prices.iloc[:count], index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def price_at(self, timestamps) -> np.ndarray:
+        """
+        Latest price at or before each time, the first price for times before it
+        Params:
+            timestamps: datetime series or index
+        Returns:
+            float array of eth prices in usd, NaN when the table is empty
+        """
+        times = pd.DataFrame({'timestamp': pd.to_datetime(np.asarray(timestamps)).astype('datetime64[ns]')})
+        prices = self.prices
+        if prices.empty:
+            return np.full(len(times), np.nan)
+        # merge_asof needs both sides sorted, transactions usually already are
+        order = None
+        if not times['timestamp'].is_monotonic_increasing:
+            order = np.argsort(times['timestamp'].to_numpy(), kind='stable')
+            times = times.iloc[order]
+        matched = pd.merge_asof(times, prices, on='timestamp', direction='backward')['eth_usd'].to_numpy()
+        matched = np.where(np.isnan(matched), prices['eth_usd'].iat[0], matched)
+        if order is not None:
+            unsorted = np.empty_like(matched)
+            unsorted[order] = matched
+            matched = unsorted
+        return matched
+
+    def to_usd(self, timestamps, gas_fees_eth) -> np.ndarray:
+        """
+        Converts eth amounts to usd at the price of their time
+        Params:
+            timestamps: datetime series of the amounts
+            gas_fees_eth: amounts in eth
+        Returns:
+            float array of amounts in usd
+        """
+        return np.asarray(gas_fees_eth, dtype='float64') * self.price_at(timestamps)
+
+
+@st.cache_resource
+def shared_price_table() -> PriceTable:
+    """
+    Price table shared by every session
+    """
+    return PriceTable.load()
+
+
+def get_price_table() -> PriceTable:
+    """
+    Price table shared by every session, re-read when another process saved it, e.g. an import
+    """
+    table = shared_price_table()
+    table.refresh()
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Imports historical eth prices into the price table')
+    parser.add_argument('csv_path', help='csv with timestamp and eth_usd columns')
+    parser.add_argument('--path', default=ETH_PRICE_PATH)
+    args = parser.parse_args()
+    added = PriceTable.load(args.path).import_csv(args.csv_path)
+    print(f'Imported {added} prices')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+# Weekly season length per series period
+SEASON_LENGTHS = {'D': 7, 'h': 168}
+# Smoothing parameters searched when fitting, level x trend x season
+ALPHAS = np.linspace(0.05, 0.95, 10)
+BETAS = np.array([0.0, 0.01, 0.05, 0.1, 0.2, 0.4])
+GAMMAS = np.array([0.0, 0.05, 0.1, 0.2, 0.4])
+# Same interval width as Prophet's default
+INTERVAL_Z = 1.2816
+
+
+def forecast_steps(periods: int, freq: str = 'D') -> int:
+    """
+    Number of series periods in a horizon of days.
+    Parameters:
+        periods (int): Number of days to forecast into the future.
+        freq (str): Period of the series, D or h.
+    Returns: Number of steps.
+    """
+    return periods * 24 if freq == 'h' else periods
+
+
+class HoltWinters:
+    """
+    Additive Holt-Winters exponential smoothing with weekly seasonality.
+
+    Every combination of the smoothing parameter grids is run at once, as
+    one row of the level, trend and season state arrays, so a fit is a
+    single pass over the series. The combination with the smallest one
+    step ahead squared error is kept.
+    """
+
+    def __init__(self, freq: str = 'D'):
+        self.freq = freq
+        self.history = None
+
+    def fit(self, series: pd.DataFrame) -> 'HoltWinters':
+        """
+        Fits the model on an aggregated series.
+        Parameters:
+            series (pd.DataFrame): ds and y columns, see timeforecast.aggregate_series.
+        Returns: The fitted model.
+        """
+        y = series['y'].to_numpy(dtype='float64')
+        if len(y) < 2:
+            raise ValueError('Holt-Winters needs at least two periods')
+        self.history = series[['ds', 'y']].reset_index(drop=True)
+        # Seasonality needs two full seasons to initialize
+        m = SEASON_LENGTHS[self.freq] if len(y) >= 2 * SEASON_LENGTHS[self.freq] else 1
+        gammas = GAMMAS if m > 1 else GAMMAS[:1]
+        alpha, beta, gamma = (grid.ravel() for grid in np.meshgrid(ALPHAS, BETAS, gammas, indexing='ij'))
+
+        # Initial state from the first two seasons
+        level = np.full(len(alpha), y[:m].mean())
+        trend = np.full(len(alpha), (y[m:2 * m].mean() - y[:m].mean()) / m if len(y) >= 2 * m else 0.0)
+        season = np.tile(y[:m] - y[:m].mean(), (len(alpha), 1))
+
+        # One pass, all parameter combinations at once
+        fitted = np.empty((len(alpha), len(y)))
+        levels = np.empty((len(alpha), len(y)))
+        seasonal = np.empty((len(alpha), len(y)))
+        for t, value in enumerate(y):
+            s = season[:, t % m]
+            fitted[:, t] = level + trend + s
+            seasonal[:, t] = s
+            new_level = alpha * (value - s) + (1 - alpha) * (level + trend)
+            trend = beta * (new_level - level) + (1 - beta) * trend
+            season[:, t % m] = gamma * (value - new_level) + (1 - gamma) * s
+            level = new_level
+            levels[:, t] = level
+
+        # Best combination, ignoring the first season the state warms up on
+        warm = m if len(y) > m else 0
+        sse = ((fitted[:, warm:] - y[warm:]) ** 2).sum(axis=1)
+        best = int(np.argmin(sse))
+        self.alpha, self.beta, self.gamma = alpha[best], beta[best], gamma[best]
+        self.season_length = m
+        self.level, self.trend = level[best], trend[best]
+        self.season = season[best]
+        self.fitted = fitted[best]
+        self.components = {'trend': fitted[best] - seasonal[best], 'weekly': seasonal[best]}
+        self.sigma = float(np.sqrt(sse[best] / max(len(y) - warm, 1)))
+        return self
+
+    def predict(self, periods: int) -> pd.DataFrame:
+        """
+        Fitted values for the history followed by the forecast.
+        Parameters:
+            periods (int): Number of days to forecast into the future.
+        Returns: DataFrame with ds, yhat, yhat_lower, yhat_upper, trend and weekly columns, like Prophet's.
+        """
+        n = len(self.history)
+        steps = np.arange(1, forecast_steps(periods, self.freq) + 1)
+        m = self.season_length
+        trend = self.level + steps * self.trend
+        weekly = self.season[(n + steps - 1) % m]
+
+        # Forecast variance grows with the horizon
+        c = self.alpha * (1 + np.arange(1, len(steps)) * self.beta)
+        c = c + self.gamma * (1 - self.alpha) * (np.arange(1, len(steps)) % m == 0)
+        spread = INTERVAL_Z * self.sigma * np.sqrt(1 + np.concatenate([[0.0], np.cumsum(c ** 2)]))
+
+        last = pd.Timestamp(self.history['ds'].iat[-1])
+        future = pd.date_range(last, periods=len(steps) + 1, freq=self.freq)[1:]
+        yhat = np.concatenate([self.fitted, trend + weekly])
+        spread = np.concatenate([np.full(n, INTERVAL_Z * self.sigma), spread])
+        return pd.DataFrame({
+            'ds': np.concatenate([self.history['ds'].to_numpy(dtype='datetime64[ns]'),
+                                  future.to_numpy(dtype='datetime64[ns]')]),
+            'yhat': yhat,
+            'yhat_lower': yhat - spread,
+            'yhat_upper': yhat + spread,
+            'trend': np.concatenate([self.components['trend'], trend]),
+            'weekly': np.concatenate([self.components['weekly'], weekly]),
+        })
+
+
+def plot_holt_winters(model: HoltWinters, forecast: pd.DataFrame) -> tuple:
+    """
+    Forecast and components figures, laid out like Prophet's plotly plots.
+    Parameters:
+        model (HoltWinters): Fitted model.
+        forecast (pd.DataFrame): Output of HoltWinters.predict.
+    Returns: Forecast figure and components figure.
+    """
+    fig1 = go.Figure([
+        go.Scatter(x=forecast['ds'], y=forecast['yhat_upper'], mode='lines', line=dict(width=0),
+                   hoverinfo='skip', showlegend=False),
+        go.Scatter(x=forecast['ds'], y=forecast['yhat_lower'], mode='lines', line=dict(width=0),
+                   fill='tonexty', fillcolor='rgba(206, 49, 4, 0.2)', hoverinfo='skip', showlegend=False),
+        go.Scatter(x=forecast['ds'], y=forecast['yhat'], mode='lines', name='Predicted'),
+        go.Scatter(x=model.history['ds'], y=model.history['y'], mode='markers', name='Actual',
+                   marker=dict(size=4)),
+    ])
+    fig1.update_layout(showlegend=False)
+
+    fig2 = make_subplots(rows=2, cols=1, subplot_titles=('trend', 'weekly'))
+    fig2.add_trace(go.Scatter(x=forecast['ds'], y=forecast['trend'], mode='lines', name='trend'), row=1, col=1)
+    # One season of the seasonal component
+    season = forecast.iloc[-model.season_length:].sort_values('ds')
+    fig2.add_trace(go.Scatter(x=season['ds'], y=season['weekly'], mode='lines', name='weekly'), row=2, col=1)
+    fig2.update_layout(showlegend=False)
+    return fig1, fig2
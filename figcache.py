@@ -0,0 +1,101 @@
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+# Figures kept, every chart of a few dataset views
+MAX_FIGURES = 256
+
+
+def frame_fingerprint(data) -> str:
+    """
+    Content hash of the metric frame or series a chart is built from
+    Params:
+        data: pandas dataframe or series
+    Returns:
+        Hex digest, equal for frames with equal labels, dtypes and values
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    columns = list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]
+    dtypes = list(data.dtypes) if isinstance(data, pd.DataFrame) else [data.dtype]
+    digest.update(repr((columns, [str(dtype) for dtype in dtypes])).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """
+    Least recently used cache of finished plotly figures, kept as json.
+
+    A hit rebuilds the figure from its json without running plotly's
+    validation again, the figure was validated when it was built. Every
+    caller gets its own figure, so no mutable figure is shared between
+    sessions.
+    """
+
+    def __init__(self, max_figures: int = MAX_FIGURES):
+        self.max_figures = max_figures
+        self.figures = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, build) -> go.Figure:
+        """
+        Gets the figure for key, building it on a miss
+        Params:
+            key: hashable key of the figure
+            build: function making the figure
+        Returns:
+            Plotly figure
+        """
+        with self.lock:
+            spec = self.figures.get(key)
+            if spec is not None:
+                self.figures.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if spec is not None:
+            # A fresh figure per caller, plotly's private flag skips the slow validation
+            return go.Figure(json.loads(spec), _validate=False)
+        # Built outside the lock, two sessions may build the same figure once each
+        figure = build()
+        with self.lock:
+            self.figures[key] = figure.to_json()
+            # Drop the least recently used figure
+            if len(self.figures) > self.max_figures:
+                self.figures.popitem(last=False)
+        return figure
+
+    def stats(self) -> dict:
+        """
+        Hits, misses and figures held
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'figures': len(self.figures)}
+
+
+@st.cache_resource
+def get_figure_cache() -> FigureCache:
+    """
+    Figure cache shared by every session
+    """
+    return FigureCache()
+
+
+def cached_figure(make_figure):
+    """
+    Caches the figures of a plot function whose first argument is its data,
+    keyed by the data's fingerprint and the other arguments, so reruns that
+    do not change the data skip building the figure
+    """
+    @functools.wraps(make_figure)
+    def wrapper(df, *args, **kwargs):
+        key = (make_figure.__qualname__, frame_fingerprint(df), repr(args), repr(sorted(kwargs.items())))
+        return get_figure_cache().get(key, lambda: make_figure(df, *args, **kwargs))
+    return wrapper
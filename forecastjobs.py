@@ -0,0 +1,122 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import streamlit as st
+from timeforecast import model_path, load_model, save_model, fit_series, predict
+
+# Forecast jobs kept for reuse, finished jobs beyond this are dropped oldest first
+MAX_JOBS = 16
+
+
+def run_forecast(series: pd.DataFrame, path: str, periods: int, freq: str) -> tuple:
+    """
+    Fits or loads a model and forecasts, runs in a worker process
+    Params:
+        series: aggregated series, see timeforecast.aggregate_series
+        path: model file, see timeforecast.model_path
+        periods: number of days to forecast
+        freq: period of the series, D or h
+    Returns:
+        Tuple: model json, forecast
+    """
+    from prophet.serialize import model_to_json
+    model = load_model(path)
+    if model is None:
+        model = fit_series(series, freq)
+        save_model(model, path)
+    return model_to_json(model), predict(model, periods, freq)
+
+
+class ForecastJob:
+    """
+    Handle to a forecast running in the pool
+    """
+
+    def __init__(self, key: tuple, future):
+        self.key = key
+        self.future = future
+        self.submitted_at = time.monotonic()
+        self.output = None
+
+    @property
+    def status(self) -> str:
+        """
+        One of queued, running, done, failed
+        """
+        if self.future.done():
+            return 'failed' if self.future.exception() is not None else 'done'
+        return 'running' if self.future.running() else 'queued'
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.submitted_at
+
+    def result(self) -> tuple:
+        """
+        Model and forecast, waiting for the job if it is not done
+        """
+        if self.output is None:
+            from prophet.serialize import model_from_json
+            model_json, forecast = self.future.result()
+            self.output = (model_from_json(model_json), forecast)
+        return self.output
+
+
+class ForecastService:
+    """
+    Runs Prophet forecasts in a process pool.
+
+    Jobs are keyed by series and horizon, so the same forecast asked for
+    by several sessions or reruns is only computed once. Workers receive
+    the aggregated series rather than the transactions, and share fitted
+    models through the json files in the forecast directory.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        # Spawned workers do not inherit the server's threads
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, series: pd.DataFrame, fingerprint: str, column: str, periods: int,
+               freq: str = 'D', how: str = 'sum') -> ForecastJob:
+        """
+        Starts a forecast, or returns the job already computing it
+        Params:
+            series: aggregated series, see timeforecast.forecast_series
+            fingerprint: fingerprint of the data
+            column: name of the column forecasted
+            periods: number of days to forecast
+            freq: period of the fitted series, D or h
+            how: aggregate per period, sum, mean or count
+        Returns:
+            Job handle
+        """
+        key = (fingerprint, column, periods, freq, how)
+        with self.lock:
+            job = self.jobs.get(key)
+            # Failed jobs are tried again
+            if job is not None and job.status != 'failed':
+                return job
+            future = self.pool.submit(run_forecast, series, model_path(fingerprint, column, freq, how), periods, freq)
+            job = self.jobs[key] = ForecastJob(key, future)
+            self.prune()
+        return job
+
+    def prune(self):
+        """
+        Drops the oldest finished jobs over MAX_JOBS
+        """
+        finished = [key for key, job in self.jobs.items() if job.future.done()]
+        for key in finished[:max(len(self.jobs) - MAX_JOBS, 0)]:
+            del self.jobs[key]
+
+
+@st.cache_resource
+def get_forecast_service() -> ForecastService:
+    """
+    Forecast service shared by every session
+    """
+    return ForecastService()
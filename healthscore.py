@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+# Band edges: scores <= the first edge are the first band, then each band
+# runs from one edge (inclusive) to the next (exclusive)
+BAND_EDGES = (0, 10, 20, 30)
+BAND_LABELS = ('Extremely bad', 'Excellent', 'Good', 'Fair', 'Poor')
+
+
+def health_score(gas_fees_usd: pd.Series, amount: pd.Series) -> pd.Series:
+    """
+    Gas fees as a percentage of the amount transferred
+    Params:
+        gas_fees_usd: gas fees in usd
+        amount: amount transferred in pyusd
+    Returns:
+        Score series, -9999 where the amount is zero
+    """
+    score = gas_fees_usd * 100 / amount
+    return score.replace([np.inf, -np.inf], -9999)
+
+
+def score_bands(scores: pd.Series, edges: tuple = BAND_EDGES, labels: tuple = BAND_LABELS) -> pd.Categorical:
+    """
+    Labels health scores with their band
+    Params:
+        scores: health scores
+        edges: ascending band edges
+        labels: band labels, one more than edges
+    Returns:
+        Ordered categorical of band labels
+    """
+    if len(labels) != len(edges) + 1:
+        raise ValueError('Expected one more label than band edges')
+    values = np.asarray(scores, dtype='float64')
+    # NaN sorts past the last edge and lands in the last band
+    codes = np.searchsorted(np.asarray(edges, dtype='float64'), values, side='right')
+    codes[values <= edges[0]] = 0
+    return pd.Categorical.from_codes(codes, categories=list(labels), ordered=True)
+
+
+def band_distribution(periods: pd.Series, bands: pd.Categorical) -> pd.DataFrame:
+    """
+    Counts transactions per period and band
+    Params:
+        periods: period label of each transaction
+        bands: band of each transaction
+    Returns:
+        Dataframe indexed by period with one column per band
+    """
+    return pd.crosstab(np.asarray(periods), bands, dropna=False).rename_axis(index=None, columns=None)
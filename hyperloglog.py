@@ -0,0 +1,167 @@
+import math
+import numpy as np
+import pandas as pd
+from rollups import period_labels, fill_periods
+
+# Precision bounds, 16 to 262144 registers
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def precision_for_error(error: float) -> int:
+    """
+    Smallest precision whose standard error is within the bound
+    Params:
+        error: relative standard error, e.g. 0.01 for 1%
+    Returns:
+        Number of index bits
+    """
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def hash64(values) -> np.ndarray:
+    """
+    Splitmix64 hash of integer values
+    """
+    z = np.asarray(values).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """
+    Number of significant bits of uint64 values
+    """
+    # Each 32 bit half is exact as a float, so frexp gives its bit length
+    high = np.frexp((values >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((values & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    return np.where(high > 0, high + 32, low)
+
+
+def register_updates(values, precision: int) -> tuple:
+    """
+    Register index and rank of each value
+    Params:
+        values: integer values, e.g. wallet ids
+        precision: number of index bits
+    Returns:
+        Tuple: register indexes, ranks (position of the first set bit after the index bits)
+    """
+    hashes = hash64(values)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    rest = hashes << np.uint64(precision)
+    rank = np.minimum(64 - bit_length(rest) + 1, 64 - precision + 1)
+    return index, rank.astype(np.uint8)
+
+
+def estimate(registers: np.ndarray) -> float:
+    """
+    HyperLogLog cardinality estimate of a register array
+    """
+    m = len(registers)
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum()
+    zeros = int(np.count_nonzero(registers == 0))
+    # Linear counting is more accurate for small cardinalities
+    if raw <= 2.5 * m and zeros:
+        return m * math.log(m / zeros)
+    return raw
+
+
+class HyperLogLog:
+    """
+    Mergeable approximate distinct counter.
+
+    Keeps 2 ** precision one byte registers whatever the number of values
+    added. Two sketches of the same precision merge with an element-wise
+    maximum, which gives the sketch of the union.
+    """
+
+    def __init__(self, precision: int = 14, registers: np.ndarray = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, values):
+        """
+        Adds integer values
+        """
+        index, rank = register_updates(values, self.precision)
+        np.maximum.at(self.registers, index, rank)
+
+    def __or__(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self) -> int:
+        """
+        Estimated number of distinct values added
+        """
+        return int(round(estimate(self.registers)))
+
+
+class PeriodSketches:
+    """
+    Approximate distinct count of values per period.
+
+    Keeps one HyperLogLog sketch per base period (hour or day). Counts for
+    coarser periods and arbitrary ranges come from merging base sketches,
+    so only the base grain is ever folded.
+    """
+
+    def __init__(self, freq: str = 'D', precision: int = 14):
+        self.freq = freq
+        self.precision = precision
+        self.sketches = {}
+
+    def fold(self, labels: pd.Series, values: pd.Series):
+        """
+        Adds values to the sketches of their periods
+        Params:
+            labels: base period label of each value
+            values: integer values, e.g. wallet ids
+        """
+        periods, inverse = np.unique(np.asarray(labels), return_inverse=True)
+        if len(periods) == 0:
+            return
+        index, rank = register_updates(values, self.precision)
+        registers = np.zeros((len(periods), 2 ** self.precision), dtype=np.uint8)
+        np.maximum.at(registers, (inverse, index), rank)
+        for period, period_registers in zip(pd.DatetimeIndex(periods), registers):
+            sketch = self.sketches.get(period)
+            if sketch is not None:
+                np.maximum(sketch.registers, period_registers, out=sketch.registers)
+            else:
+                self.sketches[period] = HyperLogLog(self.precision, period_registers)
+
+    def result(self, freq: str = None) -> pd.Series:
+        """
+        Distinct counts per period
+        Params:
+            freq: one of h, D, W, ME no finer than the base period, defaults to the base period
+        Returns:
+            Series of counts indexed by period, empty periods filled with 0
+        """
+        freq = freq or self.freq
+        periods = pd.Series(list(self.sketches), dtype='datetime64[ns]')
+        merged = {}
+        for label, period in zip(period_labels(periods, freq), periods):
+            sketch = self.sketches[period]
+            merged[label] = merged[label] | sketch if label in merged else sketch
+        counts = pd.Series({label: sketch.count() for label, sketch in merged.items()}, dtype='int64')
+        return fill_periods(counts.sort_index(), freq)
+
+    def count(self, start=None, end=None) -> int:
+        """
+        Distinct count over a range of base periods
+        Params:
+            start: first period included, from the beginning when None
+            end: last period included, to the end when None
+        Returns:
+            Estimated number of distinct values
+        """
+        merged = HyperLogLog(self.precision)
+        for period, sketch in self.sketches.items():
+            if (start is None or period >= pd.Timestamp(start)) and (end is None or period <= pd.Timestamp(end)):
+                np.maximum(merged.registers, sketch.registers, out=merged.registers)
+        return merged.count()
@@ -0,0 +1,275 @@
+"""
+Ingests PYUSD Transfer events from an Ethereum JSON-RPC node into the dataset
+
+Usage:
+    python ingest.py --rpc-url https://... [--start-block N] [--end-block N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import aiohttp
+import pandas as pd
+from datastore import PARQUET_PATH, INGEST_CHECKPOINT_PATH, append_batches, max_block, migrate_store, to_table
+
+# PYUSD token, as used by get_and_format
+PYUSD_ADDRESS = '0x6c3ea9036406852006290770bedfcaba0e23a0e8'
+PYUSD_DECIMALS = 6
+# Block the token contract was deployed in
+PYUSD_DEPLOY_BLOCK = 15921958
+# keccak256('Transfer(address,address,uint256)')
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+# Blocks behind the head left out, so reorged logs are not stored
+CONFIRMATIONS = 12
+# Blocks asked for per eth_getLogs call, split when the node refuses a range
+LOG_RANGE = 2000
+# Blocks ingested and published per checkpoint
+SEGMENT_BLOCKS = 20000
+# Requests in flight at once
+MAX_CONCURRENCY = 4
+# Calls per json-rpc batch for receipts and blocks
+BATCH_SIZE = 50
+# Seconds before a request is abandoned
+REQUEST_TIMEOUT = 30
+# Error messages nodes use when a log query covers too much
+TOO_LARGE = ('more than', 'too many', 'limit', 'range', 'exceed', 'too large')
+
+
+class RpcError(Exception):
+    """
+    Node answered a call with an error
+    """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f'{code}: {message}')
+        self.code = code
+        self.message = message
+
+
+def reply_result(reply: dict):
+    """
+    Result of a json-rpc reply, raising RpcError when the node answered with an error
+    """
+    if 'error' in reply:
+        raise RpcError(reply['error'].get('code'), reply['error'].get('message', ''))
+    return reply['result']
+
+
+class RpcClient:
+    """
+    Json-rpc client sharing one connection pool, with a bound on requests in flight
+    """
+
+    def __init__(self, url: str, session: aiohttp.ClientSession, max_concurrency: int = MAX_CONCURRENCY,
+                 timeout: float = REQUEST_TIMEOUT):
+        self.url = url
+        self.session = session
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.next_id = 0
+
+    async def post(self, payload):
+        """
+        Sends a request or a batch of requests
+        """
+        async with self.semaphore:
+            async with self.session.post(self.url, json=payload, timeout=self.timeout) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    def request(self, method: str, params: list) -> dict:
+        self.next_id += 1
+        return {'jsonrpc': '2.0', 'id': self.next_id, 'method': method, 'params': params}
+
+    async def call(self, method: str, params: list):
+        """
+        Calls one method
+        Returns:
+            The result field of the response
+        """
+        return reply_result(await self.post(self.request(method, params)))
+
+    async def batch(self, method: str, params_list: list) -> list:
+        """
+        Calls one method for each params in batches of BATCH_SIZE, batches run concurrently.
+        A batch the node refuses as a whole is split in halves down to single calls
+        Returns:
+            Results in the order of params_list
+        """
+        async def send(chunk):
+            requests = [self.request(method, params) for params in chunk]
+            replies = await self.post(requests)
+            # One object instead of a list, e.g. an error for a batch that is too large or rate limited
+            if isinstance(replies, dict):
+                if len(chunk) == 1:
+                    return [reply_result(replies)]
+                middle = len(chunk) // 2
+                halves = await asyncio.gather(send(chunk[:middle]), send(chunk[middle:]))
+                return halves[0] + halves[1]
+            replies = {reply['id']: reply for reply in replies}
+            return [reply_result(replies[request['id']]) for request in requests]
+
+        chunks = [params_list[i:i + BATCH_SIZE] for i in range(0, len(params_list), BATCH_SIZE)]
+        results = await asyncio.gather(*(send(chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+
+def too_large(error: Exception) -> bool:
+    """
+    Whether a failed log query should be retried over smaller ranges
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, RpcError):
+        return error.code == -32005 or any(text in error.message.lower() for text in TOO_LARGE)
+    return False
+
+
+async def get_logs(client: RpcClient, start: int, end: int) -> list:
+    """
+    Transfer logs of a block range, halving the range while the node refuses it
+    Params:
+        client: json-rpc client
+        start: first block included
+        end: last block included
+    Returns:
+        List of log objects
+    """
+    log_filter = {'address': PYUSD_ADDRESS, 'topics': [TRANSFER_TOPIC],
+                  'fromBlock': hex(start), 'toBlock': hex(end)}
+    try:
+        return await client.call('eth_getLogs', [log_filter])
+    except Exception as e:
+        if start == end or not too_large(e):
+            raise
+    middle = (start + end) // 2
+    halves = await asyncio.gather(get_logs(client, start, middle), get_logs(client, middle + 1, end))
+    return halves[0] + halves[1]
+
+
+def decode_transfers(logs: list) -> pd.DataFrame:
+    """
+    Decodes Transfer logs
+    Params:
+        logs: log objects from eth_getLogs
+    Returns:
+        Dataframe of tx_hash, block_number, log_index, from_address, to_address and amount in PYUSD
+    """
+    logs = [log for log in logs if not log.get('removed') and len(log['topics']) == 3]
+    return pd.DataFrame({
+        'tx_hash': [log['transactionHash'] for log in logs],
+        'block_number': [int(log['blockNumber'], 16) for log in logs],
+        'log_index': [int(log['logIndex'], 16) for log in logs],
+        # Indexed addresses are the last 20 bytes of the topics
+        'from_address': ['0x' + log['topics'][1][-40:] for log in logs],
+        'to_address': ['0x' + log['topics'][2][-40:] for log in logs],
+        'amount': [int(log['data'], 16) / 10 ** PYUSD_DECIMALS for log in logs],
+    })
+
+
+async def fetch_segment(client: RpcClient, start: int, end: int, log_range: int = LOG_RANGE) -> pd.DataFrame:
+    """
+    Transfers of a block range in the dataset format
+    Params:
+        client: json-rpc client
+        start: first block included
+        end: last block included
+        log_range: blocks per eth_getLogs call
+    Returns:
+        Dataframe with the dataset columns, in block and log order
+    """
+    ranges = [(first, min(first + log_range - 1, end)) for first in range(start, end + 1, log_range)]
+    logs = await asyncio.gather(*(get_logs(client, first, last) for first, last in ranges))
+    transfers = decode_transfers([log for part in logs for log in part])
+    if transfers.empty:
+        return transfers
+    transfers = transfers.sort_values(['block_number', 'log_index'])
+
+    # Gas fees from the receipts, timestamps from the blocks, one lookup per transaction and block
+    tx_hashes = transfers['tx_hash'].unique().tolist()
+    block_numbers = transfers['block_number'].unique().tolist()
+    receipts, blocks = await asyncio.gather(
+        client.batch('eth_getTransactionReceipt', [[tx_hash] for tx_hash in tx_hashes]),
+        client.batch('eth_getBlockByNumber', [[hex(block), False] for block in block_numbers]))
+    fees = {tx_hash: int(receipt['gasUsed'], 16) * int(receipt['effectiveGasPrice'], 16) / 10 ** 18
+            for tx_hash, receipt in zip(tx_hashes, receipts)}
+    timestamps = {block: int(header['timestamp'], 16) for block, header in zip(block_numbers, blocks)}
+    transfers['gas_fees_eth'] = transfers['tx_hash'].map(fees)
+    transfers['timestamp'] = pd.to_datetime(transfers['block_number'].map(timestamps), unit='s')
+    return transfers.drop(columns='log_index').reset_index(drop=True)
+
+
+def read_checkpoint(path: str = INGEST_CHECKPOINT_PATH):
+    """
+    Last block ingested, None when nothing was ingested
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['block']
+
+
+def write_checkpoint(block: int, path: str = INGEST_CHECKPOINT_PATH):
+    """
+    Records the last block ingested, replacing the file atomically
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'block': block}, f)
+    os.replace(f'{path}.tmp', path)
+
+
+async def ingest(rpc_url: str, start_block: int = None, end_block: int = None, path: str = PARQUET_PATH,
+                 checkpoint_path: str = INGEST_CHECKPOINT_PATH, segment_blocks: int = SEGMENT_BLOCKS,
+                 log_range: int = LOG_RANGE, max_concurrency: int = MAX_CONCURRENCY) -> int:
+    """
+    Ingests transfers after the checkpoint into the parquet store
+    Params:
+        rpc_url: json-rpc endpoint
+        start_block: first block, after the checkpoint or the stored max block when None
+        end_block: last block, CONFIRMATIONS behind the head when None
+        path: parquet store directory to add to
+        checkpoint_path: file recording the last block ingested
+        segment_blocks: blocks published per checkpoint
+        log_range: blocks per eth_getLogs call
+        max_concurrency: requests in flight at once
+    Returns:
+        Number of rows added
+    """
+    migrate_store(path, csv_path=None)
+    if start_block is None:
+        # Resume after whichever is further, a crash can publish rows before the checkpoint is written
+        done = [block for block in (read_checkpoint(checkpoint_path), max_block(path)) if block is not None]
+        start_block = max(done) + 1 if done else PYUSD_DEPLOY_BLOCK
+
+    added = 0
+    async with aiohttp.ClientSession() as session:
+        client = RpcClient(rpc_url, session, max_concurrency)
+        if end_block is None:
+            end_block = int(await client.call('eth_blockNumber', []), 16) - CONFIRMATIONS
+        for start in range(start_block, end_block + 1, segment_blocks):
+            end = min(start + segment_blocks - 1, end_block)
+            transfers = await fetch_segment(client, start, end, log_range)
+            # Each segment is a new store version, published atomically
+            if not transfers.empty:
+                added += append_batches([to_table(transfers)], path)
+            write_checkpoint(end, checkpoint_path)
+            print(f'Blocks {start}-{end}: {len(transfers)} transfers')
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rpc-url', default=os.environ.get('ETH_RPC_URL'))
+    parser.add_argument('--start-block', type=int)
+    parser.add_argument('--end-block', type=int)
+    parser.add_argument('--path', default=PARQUET_PATH)
+    args = parser.parse_args()
+    if not args.rpc_url:
+        parser.error('--rpc-url or ETH_RPC_URL is required')
+    added = asyncio.run(ingest(args.rpc_url, args.start_block, args.end_block, args.path))
+    print(f'Added {added} rows')
+
+
+if __name__ == '__main__':
+    main()
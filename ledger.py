@@ -0,0 +1,231 @@
+import threading
+import numpy as np
+import pandas as pd
+from timeindex import TimeIndex
+
+
+def top_n(values: np.ndarray, n: int) -> np.ndarray:
+    """
+    Indices of the n largest values, largest first, without a full sort
+    """
+    if len(values) > n:
+        candidates = np.argpartition(values, -n)[-n:]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(values[candidates])[::-1]]
+
+
+def sum_by_id(ids: np.ndarray, weights: dict, size: int) -> dict:
+    """
+    Sums each weight array per id
+    """
+    return {name: np.bincount(ids, weight, minlength=size) for name, weight in weights.items()}
+
+
+class TopK:
+    """
+    Ids of the k largest values, maintained as the values change.
+
+    Every id outside the kept set is known to be no larger than bound, so
+    kept ids at or above the bound are in their true order. Updates only
+    look at the kept ids and the ids that changed, and the set is rebuilt
+    from all values when too few kept ids are above the bound.
+    """
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.ids = None
+        self.bound = -np.inf
+
+    def rebuild(self, values: np.ndarray):
+        """
+        Picks the k largest values from scratch
+        """
+        self.ids = top_n(values, self.k)
+        outside = len(values) > len(self.ids)
+        self.bound = values[self.ids].min() if outside else -np.inf
+
+    def update(self, values: np.ndarray, changed: np.ndarray):
+        """
+        Accounts for changed ids
+        Params:
+            values: all values, indexed by id
+            changed: ids whose value changed
+        """
+        if self.ids is None:
+            self.rebuild(values)
+            return
+        candidates = np.union1d(self.ids, changed)
+        order = candidates[np.argsort(values[candidates], kind='stable')[::-1]]
+        self.ids, evicted = order[:self.k], order[self.k:]
+        if len(evicted):
+            self.bound = max(self.bound, values[evicted].max())
+
+    def top(self, values: np.ndarray, n: int) -> np.ndarray:
+        """
+        Ids of the n largest values, largest first
+        """
+        if self.ids is None:
+            self.rebuild(values)
+        ids = self.ids[values[self.ids] >= self.bound]
+        if len(ids) < min(n, len(values)):
+            self.rebuild(values)
+            ids = self.ids
+        return ids[:n]
+
+
+class BalanceLedger:
+    """
+    Running pyusd balance per wallet id.
+
+    Keeps sent, received and last seen block per wallet plus the net flow
+    of every wallet per day. Rows at or below the last folded block are
+    skipped, but the ledger cannot tell whether rows are missing above it,
+    so it must be fed by a single dataset view. Whole history queries read
+    the running totals and a maintained top k, date ranges replay the
+    daily deltas they cover.
+    """
+
+    def __init__(self, k: int = 100):
+        self.lock = threading.Lock()
+        self.k = k
+        self.reset()
+
+    def reset(self):
+        """
+        Empties the ledger
+        """
+        self.first_block = None
+        self.watermark = None
+        self.sent = np.zeros(0)
+        self.received = np.zeros(0)
+        self.last_block = np.zeros(0, dtype=np.int64)
+        self.days = {}
+        self.top_balances = TopK(self.k)
+
+    @property
+    def balance(self) -> np.ndarray:
+        return self.received - self.sent
+
+    def grow(self, size: int):
+        """
+        Pads the per wallet arrays up to size
+        """
+        extra = size - len(self.sent)
+        if extra > 0:
+            self.sent = np.concatenate([self.sent, np.zeros(extra)])
+            self.received = np.concatenate([self.received, np.zeros(extra)])
+            self.last_block = np.concatenate([self.last_block, np.full(extra, -1, dtype=np.int64)])
+
+    def fold(self, chunk: pd.DataFrame):
+        """
+        Adds transfers above the last folded block
+        Params:
+            chunk: transactions with from_id, to_id, amount, block_number and timestamp
+        """
+        if chunk.empty:
+            return
+        # History before the ledger's first block, start over
+        if self.first_block is not None and chunk['block_number'].iat[0] < self.first_block:
+            self.reset()
+        if self.watermark is not None:
+            chunk = chunk.iloc[TimeIndex(chunk).block_slice(start=self.watermark + 1)]
+        if chunk.empty:
+            return
+        if self.first_block is None:
+            self.first_block = int(chunk['block_number'].iat[0])
+
+        # Each transfer debits the sender and credits the receiver
+        ids = np.concatenate([chunk['from_id'].to_numpy(), chunk['to_id'].to_numpy()])
+        amount = chunk['amount'].to_numpy(dtype='float64')
+        zeros = np.zeros(len(amount))
+        sent = np.concatenate([amount, zeros])
+        received = np.concatenate([zeros, amount])
+        block = np.tile(chunk['block_number'].to_numpy(dtype=np.int64), 2)
+        days = np.tile(chunk['timestamp'].to_numpy().astype('datetime64[D]'), 2)
+
+        # Running totals
+        self.grow(int(ids.max()) + 1)
+        totals = sum_by_id(ids, {'sent': sent, 'received': received}, len(self.sent))
+        self.sent += totals['sent']
+        self.received += totals['received']
+        np.maximum.at(self.last_block, ids, block)
+
+        # Daily deltas
+        order = np.argsort(days, kind='stable')
+        labels, starts = np.unique(days[order], return_index=True)
+        for day, part in zip(labels, np.split(order, starts[1:])):
+            self.fold_day(pd.Timestamp(day), ids[part], sent[part], received[part])
+
+        changed = np.unique(ids)
+        self.top_balances.update(self.balance, changed)
+        self.watermark = int(chunk['block_number'].iat[-1])
+
+    def fold_day(self, day: pd.Timestamp, ids: np.ndarray, sent: np.ndarray, received: np.ndarray):
+        """
+        Merges flows into a day's compacted deltas
+        """
+        if day in self.days:
+            old_ids, old_sent, old_received = self.days[day]
+            ids = np.concatenate([old_ids, ids])
+            sent = np.concatenate([old_sent, sent])
+            received = np.concatenate([old_received, received])
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = sum_by_id(inverse, {'sent': sent, 'received': received}, len(unique_ids))
+        self.days[day] = (unique_ids.astype(np.int32), totals['sent'], totals['received'])
+
+    def replay(self, start=None, end=None) -> tuple:
+        """
+        Sums the daily deltas of a date range
+        Params:
+            start: first day included, from the beginning when None
+            end: last day included, to the end when None
+        Returns:
+            Tuple: sent, received arrays indexed by wallet id
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        deltas = [delta for day, delta in self.days.items()
+                  if (start is None or day >= start) and (end is None or day <= end)]
+        if not deltas:
+            return np.zeros(len(self.sent)), np.zeros(len(self.sent))
+        ids, sent, received = (np.concatenate(parts) for parts in zip(*deltas))
+        totals = sum_by_id(ids, {'sent': sent, 'received': received}, len(self.sent))
+        return totals['sent'], totals['received']
+
+    def top_holders(self, n: int = 5, start=None, end=None) -> pd.DataFrame:
+        """
+        Wallets with the largest positive net flow
+        Params:
+            n: number of wallets
+            start: first day of the range, the whole history when both start and end are None
+            end: last day of the range
+        Returns:
+            Dataframe of wallet ids and balances, largest first
+        """
+        if start is None and end is None:
+            balance = self.balance
+            top_ids = self.top_balances.top(balance, n)
+        else:
+            sent, received = self.replay(start, end)
+            balance = received - sent
+            top_ids = top_n(balance, n)
+        top_ids = top_ids[balance[top_ids] > 0]
+        return pd.DataFrame({'id': top_ids, 'balance_usd': balance[top_ids]})
+
+    def largest_changes(self, n: int = 5, start=None, end=None) -> pd.DataFrame:
+        """
+        Wallets whose balance moved the most over a date range
+        Params:
+            n: number of wallets
+            start: first day included, from the beginning when None
+            end: last day included, to the end when None
+        Returns:
+            Dataframe of wallet ids, net change and last seen block, largest move first
+        """
+        sent, received = self.replay(start, end)
+        change = received - sent
+        top_ids = top_n(np.abs(change), n)
+        top_ids = top_ids[change[top_ids] != 0]
+        return pd.DataFrame({'id': top_ids, 'change_usd': change[top_ids],
+                             'last_block': self.last_block[top_ids]})
@@ -0,0 +1,634 @@
+import threading
+import pandas as pd
+import numpy as np
+from addressbook import AddressBook
+from ethprices import PriceTable
+from rollups import RollupCube, period_labels, fill_periods
+from hyperloglog import HyperLogLog, PeriodSketches, precision_for_error
+from ledger import BalanceLedger, top_n
+from blockindex import BlockIndex
+from timeindex import TimeIndex
+from retention import CohortRetention, retention_rate
+from healthscore import BAND_EDGES, BAND_LABELS, health_score, score_bands, band_distribution
+
+# Dex routers
+DEX = {
+    '0x4a4d2410c3d4cfa8dd0d275bedefbd2f7b61ba2e': 'uniswapv2',
+    '0x13394005c1012e708fce1eb974f1130fdc73a5ce': 'uniswapv3',
+    '0xf313d711d71eb9a607b4a61a827a9e32a7846621': 'uniswapv3',
+}
+
+# Shortest run of blocks without transactions reported as a gap, about an hour
+BLOCK_GAP = 300
+
+def prepare_transactions(dataframe: pd.DataFrame, prices: PriceTable) -> pd.DataFrame:
+    """
+    Adds the derived columns used by the metrics
+    Params:
+        dataframe: Dataframe containing the dataset
+        prices: eth prices used for gas fees in usd
+    Returns:
+        Copy of the dataframe with rounded amount, gas_fees_usd and parsed timestamp
+    """
+    dataframe = dataframe.copy()
+    dataframe['amount'] = round(dataframe['amount'], 3)
+    if not pd.api.types.is_datetime64_any_dtype(dataframe['timestamp']):
+        dataframe['timestamp'] = pd.to_datetime(dataframe['timestamp'])
+    # Each fee at the eth price of its time
+    dataframe['gas_fees_usd'] = np.round(prices.to_usd(dataframe['timestamp'], dataframe['gas_fees_eth']), 3)
+    return dataframe
+
+
+class PeriodDistinct:
+    """
+    Exact distinct count of values per period.
+
+    Only the newest period can receive more rows, so only its values are kept.
+    """
+
+    def __init__(self, freq: str):
+        self.freq = freq
+        self.counts = pd.Series(dtype='int64')
+        self.open_label = None
+        self.open_values = set()
+
+    def fold(self, labels: pd.Series, values: pd.Series):
+        frame = pd.DataFrame({'label': labels.values, 'value': values.values})
+        counts = frame.groupby('label')['value'].nunique()
+        if counts.empty:
+            return
+        # The open period continues into this chunk
+        if self.open_label in counts.index:
+            self.open_values.update(frame.loc[frame['label'] == self.open_label, 'value'].unique())
+            counts[self.open_label] = len(self.open_values)
+        last = counts.index.max()
+        if last != self.open_label:
+            self.open_label = last
+            self.open_values = set(frame.loc[frame['label'] == last, 'value'].unique())
+        # Earlier periods are final, only labels of this chunk change
+        if self.counts.empty:
+            self.counts = counts.astype('int64')
+        else:
+            self.counts = counts.combine_first(self.counts).astype('int64')
+
+    def result(self) -> pd.Series:
+        return fill_periods(self.counts.sort_index(), self.freq)
+
+
+def grow(values: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """
+    Pads a per wallet id array up to size
+    """
+    if len(values) >= size:
+        return values
+    return np.concatenate([values, np.full(size - len(values), fill, dtype=values.dtype)])
+
+
+class AddressTotals:
+    """
+    Per wallet id sums, grown as the address book grows
+    """
+
+    def __init__(self, columns: list):
+        self.values = {column: np.zeros(0) for column in columns}
+
+    def fold(self, ids: np.ndarray, weights: dict):
+        if len(ids) == 0:
+            return
+        size = int(ids.max()) + 1
+        for column, weight in weights.items():
+            values = grow(self.values[column], size)
+            np.add.at(values, ids, 1 if weight is None else weight)
+            self.values[column] = values
+
+    def frame(self) -> pd.DataFrame:
+        size = max(len(values) for values in self.values.values())
+        return pd.DataFrame({column: grow(values, size) for column, values in self.values.items()})
+
+
+class MetricGroup:
+    """
+    Aggregates behind a named group of metrics.
+
+    Each group keeps its own watermark, so it only folds rows when its
+    metrics are first requested, and memoizes its result until new rows
+    arrive.
+    """
+    keys = ()
+    # Whether the group reads the shared rollup cube
+    uses_rollups = False
+    # Engine options passed to the constructor, see MetricsEngine
+    options = ()
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube):
+        self.address_book = address_book
+        self.rollups = rollups
+        self.watermark = None
+        self.row_count = 0
+        self.cached = None
+
+    def fold(self, chunk: pd.DataFrame):
+        raise NotImplementedError
+
+    def result(self) -> dict:
+        raise NotImplementedError
+
+    def restore(self, dataframe: pd.DataFrame):
+        """
+        Hook to load persisted aggregates before the first fold
+        """
+
+    def persist(self, first_block: int):
+        """
+        Hook to save aggregates after a fold
+        """
+
+
+class RollupMetrics(MetricGroup):
+    """
+    Keeps the shared hour x dex x category rollup cube up to date
+    """
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube):
+        super().__init__(address_book, rollups)
+        self.dex = dict(zip(address_book.encode(list(DEX)), DEX.values()))
+
+    def fold(self, chunk: pd.DataFrame):
+        self.rollups.fold(chunk, chunk['to_id'].map(self.dex))
+
+    def result(self) -> dict:
+        return {}
+
+    def restore(self, dataframe: pd.DataFrame):
+        # Adopt the materialized table if this view extends the history it covers
+        meta = self.rollups.read_meta()
+        if meta is None:
+            return
+        index = TimeIndex(dataframe)
+        if index.blocks[0] != meta['first_block'] or index.block_slice(end=meta['watermark']).stop != meta['row_count']:
+            return
+        # Fees priced with prices that have since been imported or replaced are rebuilt
+        if self.rollups.prices_changed(meta):
+            return
+        self.rollups.load()
+        self.watermark = meta['watermark']
+        self.row_count = meta['row_count']
+
+    def persist(self, first_block: int):
+        if self.rollups.path is None:
+            return
+        # Never replace a table covering more history with a date filtered view
+        meta = self.rollups.read_meta()
+        if meta is not None and meta['first_block'] < first_block:
+            return
+        self.rollups.save(first_block=int(first_block), watermark=int(self.watermark), row_count=int(self.row_count))
+
+
+class KpiMetrics(MetricGroup):
+    """
+    Headline cards: totals and active wallets
+    """
+    keys = ('total_transaction_volume', 'total_transaction_cnt', 'total_revenue', 'active_wallets')
+    options = ('distinct_error',)
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube, distinct_error: float = None):
+        super().__init__(address_book, rollups)
+        self.total_volume = 0.0
+        self.total_tx = 0
+        self.total_fees = 0.0
+        # Exact flags per wallet id, or a sketch within the error bound
+        if distinct_error is None:
+            self.wallets = np.zeros(0, dtype=bool)
+        else:
+            self.wallets = HyperLogLog(precision_for_error(distinct_error))
+
+    def fold(self, chunk: pd.DataFrame):
+        self.total_volume += chunk['amount'].sum()
+        # Transactions never straddle two chunks
+        self.total_tx += chunk['tx_hash'].nunique()
+        self.total_fees += chunk['gas_fees_usd'].sum()
+        wallets = np.concatenate([chunk['from_id'].to_numpy(), chunk['to_id'].to_numpy()])
+        if isinstance(self.wallets, HyperLogLog):
+            self.wallets.add(wallets)
+        else:
+            self.wallets = grow(self.wallets, int(wallets.max()) + 1, False)
+            self.wallets[wallets] = True
+
+    def result(self) -> dict:
+        if isinstance(self.wallets, HyperLogLog):
+            active_wallets = self.wallets.count()
+        else:
+            active_wallets = int(self.wallets.sum())
+        return {
+            'total_transaction_volume': round(self.total_volume / 10**9, 2),
+            'total_transaction_cnt': round(self.total_tx / 10**3, 2),
+            'total_revenue': round(self.total_fees / 10**3, 2),
+            'active_wallets': round(active_wallets / 10**3, 2),
+        }
+
+
+class ReachMetrics(MetricGroup):
+    """
+    Reach tab: top senders / receivers, wallet activity and daily reach
+    """
+    keys = ('daily_reach', 'active_wal_daily', 'active_wal_wkly', 'active_wal_montly',
+            'top_senders', 'top_receivers')
+    options = ('distinct_error',)
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube, distinct_error: float = None):
+        super().__init__(address_book, rollups)
+        if distinct_error is None:
+            self.reach_from = PeriodDistinct('D')
+            self.reach_to = PeriodDistinct('D')
+            self.active = {freq: PeriodDistinct(freq) for freq in ('D', 'W', 'ME')}
+        else:
+            # Daily sketches, weeks and months are merged from days
+            precision = precision_for_error(distinct_error)
+            self.reach_from = PeriodSketches('D', precision)
+            self.reach_to = PeriodSketches('D', precision)
+            self.active = PeriodSketches('D', precision)
+        party_cols = ['total_amount', 'total_fees_usd', 'total_fees_eth', 'transaction_count']
+        self.senders = AddressTotals(party_cols)
+        self.receivers = AddressTotals(party_cols)
+
+    def fold(self, chunk: pd.DataFrame):
+        timestamps = chunk['timestamp']
+
+        # Daily reach
+        days = period_labels(timestamps, 'D')
+        self.reach_from.fold(days, chunk['from_id'])
+        self.reach_to.fold(days, chunk['to_id'])
+
+        # Active wallets -- daily -- weekly -- monthly
+        wallets = pd.concat([chunk['from_id'], chunk['to_id']], ignore_index=True)
+        if isinstance(self.active, PeriodSketches):
+            self.active.fold(pd.concat([days, days], ignore_index=True), wallets)
+        else:
+            for freq, distinct in self.active.items():
+                labels = period_labels(timestamps, freq)
+                distinct.fold(pd.concat([labels, labels], ignore_index=True), wallets)
+
+        # Top senders and receivers
+        for column, totals in (('from_id', self.senders), ('to_id', self.receivers)):
+            totals.fold(chunk[column].to_numpy(), {
+                'total_amount': chunk['amount'].to_numpy(),
+                'total_fees_usd': chunk['gas_fees_usd'].to_numpy(),
+                'total_fees_eth': chunk['gas_fees_eth'].to_numpy(),
+                'transaction_count': None,
+            })
+
+    def result(self) -> dict:
+        # Daily reach
+        daily_reach = pd.DataFrame({
+            'from_address': self.reach_from.result(),
+            'to_address': self.reach_to.result(),
+        }).fillna(0).astype('int64').rename_axis('timestamp').reset_index()
+
+        # Active wallets -- daily -- weekly --monthly
+        if isinstance(self.active, PeriodSketches):
+            active = {freq: self.active.result(freq) for freq in ('D', 'W', 'ME')}
+        else:
+            active = {freq: distinct.result() for freq, distinct in self.active.items()}
+        active_wal = {
+            freq: counts.rename('active_wallet').rename_axis('date').reset_index()
+            for freq, counts in active.items()
+        }
+        return {
+            'daily_reach': daily_reach,
+            'active_wal_daily': active_wal['D'],
+            'active_wal_wkly': active_wal['W'],
+            'active_wal_montly': active_wal['ME'],
+            'top_senders': self.top_parties(self.senders.frame(), 'from_address'),
+            'top_receivers': self.top_parties(self.receivers.frame(), 'to_address'),
+        }
+
+    def top_parties(self, totals: pd.DataFrame, column: str, n: int = 6) -> pd.DataFrame:
+        """
+        Top addresses by transaction count, decoded back to address strings
+        """
+        counts = totals['transaction_count'].to_numpy()
+        top_ids = top_n(counts, n)
+        top_ids = top_ids[counts[top_ids] > 0]
+        top = totals.iloc[top_ids].astype({'transaction_count': 'int64'})
+        top.insert(0, column, self.address_book.decode(top_ids))
+        return top.reset_index(drop=True)
+
+
+# Cohort frequency -> heatmap axis unit
+COHORT_UNITS = {'D': 'Day', 'W': 'Week', 'ME': 'Month'}
+
+
+class RetentionMetrics(MetricGroup):
+    """
+    Retention tab: wallet cohorts
+    """
+    keys = ('retention_rate', 'retention_unit')
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube, freq: str = 'W'):
+        super().__init__(address_book, rollups)
+        self.cohorts = CohortRetention(freq)
+
+    def fold(self, chunk: pd.DataFrame):
+        # Retention
+        timestamps = chunk['timestamp'].to_numpy()
+        self.cohorts.fold(np.concatenate([chunk['from_id'].to_numpy(), chunk['to_id'].to_numpy()]),
+                          np.concatenate([timestamps, timestamps]))
+
+    def result(self) -> dict:
+        # Retention Rate, the heatmap is built by myhelpers.make_heatmap
+        return {
+            'retention_rate': retention_rate(self.cohorts.table()),
+            'retention_unit': COHORT_UNITS[self.cohorts.freq],
+        }
+
+
+class HolderMetrics(MetricGroup):
+    """
+    Top holders and the day's largest balance changes, read from the balance ledger
+    """
+    keys = ('top_holders', 'balance_changes')
+    options = ('ledger',)
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube, ledger: BalanceLedger = None):
+        super().__init__(address_book, rollups)
+        self.ledger = ledger if ledger is not None else BalanceLedger()
+        self.last_day = None
+
+    def fold(self, chunk: pd.DataFrame):
+        self.last_day = chunk['timestamp'].iat[-1].normalize()
+        with self.ledger.lock:
+            self.ledger.fold(chunk)
+
+    def result(self) -> dict:
+        with self.ledger.lock:
+            # The ledger holds exactly this view's rows
+            top_holders = self.ledger.top_holders(5)
+            balance_changes = self.ledger.largest_changes(5, start=self.last_day)
+        for frame in (top_holders, balance_changes):
+            frame.insert(0, 'address', self.address_book.decode(frame.pop('id')))
+        return {
+            'top_holders': top_holders,
+            'balance_changes': balance_changes,
+        }
+
+
+class RevenueMetrics(MetricGroup):
+    """
+    Revenue tab: transaction volume, average fees and block stats
+    """
+    keys = ('transact_vol_by_hour', 'transact_vol_by_day', 'transact_vol_by_week',
+            'hr_avg_fee', 'day_avg_fee', 'week_avg_fee',
+            'block_avg_fee', 'block_avg_amt', 'block_trans_cnt', 'block_gaps')
+    uses_rollups = True
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube):
+        super().__init__(address_book, rollups)
+        self.blocks = BlockIndex()
+
+    def fold(self, chunk: pd.DataFrame):
+        # By block number, blocks never straddle two chunks
+        self.blocks.fold(chunk)
+
+    def result(self) -> dict:
+        # Transaction volume and average fees over time
+        series = {freq: self.rollups.rollup(freq) for freq in ('h', 'D', 'W')}
+        transact_vol = {
+            freq: frame['amount_count'].astype('int64').rename('amount').rename_axis('date').reset_index()
+            for freq, frame in series.items()
+        }
+        avg_fee = {
+            freq: (frame['gas_fees_usd_sum'] / frame['gas_fees_usd_count'].replace(0, np.nan))
+            .rename('gas_fees_usd').rename_axis('date').reset_index()
+            for freq, frame in series.items()
+        }
+
+        return {
+            'transact_vol_by_hour': transact_vol['h'],
+            'transact_vol_by_day': transact_vol['D'],
+            'transact_vol_by_week': transact_vol['W'],
+            'hr_avg_fee': avg_fee['h'],
+            'day_avg_fee': avg_fee['D'],
+            'week_avg_fee': avg_fee['W'],
+            'block_avg_fee': self.blocks.top('gas_fees_usd_mean').rename(columns={'gas_fees_usd_mean': 'gas_fees_usd'}),
+            'block_avg_amt': self.blocks.top('amount_mean').rename(columns={'amount_mean': 'amount'}),
+            'block_trans_cnt': self.blocks.top('tx_count').rename(columns={'tx_count': 'tx_hash'}),
+            'block_gaps': self.blocks.gaps(BLOCK_GAP),
+        }
+
+
+class SwapMetrics(MetricGroup):
+    """
+    Swaps tab: dex swaps overall and on uniswapv3
+    """
+    keys = ('daily_swaps', 'wkly_swaps', 'monthly_swaps',
+            'uniswapv3_daily_swaps', 'uniswapv3_wkly_swaps', 'uniswapv3_monthly_swaps',
+            'dex_counts')
+    uses_rollups = True
+
+    def fold(self, chunk: pd.DataFrame):
+        # Everything is served from the rollup cube
+        pass
+
+    def result(self) -> dict:
+        return {
+            'daily_swaps': swap_frame(self.rollups.rollup('D', category='swap')),
+            'wkly_swaps': swap_frame(self.rollups.rollup('W', category='swap')),
+            'monthly_swaps': swap_frame(self.rollups.rollup('ME', category='swap')),
+            'uniswapv3_daily_swaps': swap_frame(self.rollups.rollup('D', dex='uniswapv3')),
+            'uniswapv3_wkly_swaps': swap_frame(self.rollups.rollup('W', dex='uniswapv3')),
+            'uniswapv3_monthly_swaps': swap_frame(self.rollups.rollup('ME', dex='uniswapv3')),
+            # Swaps per dex, the pie chart is built by myhelpers.make_pie
+            'dex_counts': self.rollups.dex_counts(),
+        }
+
+
+class HealthMetrics(MetricGroup):
+    """
+    Health score tab: transaction health score bands, overall and over time
+    """
+    keys = ('transaction_health_score_label', 'transaction_health_score_daily', 'transaction_health_score_wkly')
+
+    def __init__(self, address_book: AddressBook, rollups: RollupCube,
+                 edges: tuple = BAND_EDGES, labels: tuple = BAND_LABELS):
+        super().__init__(address_book, rollups)
+        self.edges = edges
+        self.labels = labels
+        self.bands = {freq: pd.DataFrame(columns=list(labels), dtype='int64') for freq in ('D', 'W')}
+
+    def fold(self, chunk: pd.DataFrame):
+        # Transaction health score
+        bands = score_bands(health_score(chunk['gas_fees_usd'], chunk['amount']), self.edges, self.labels)
+        for freq, totals in self.bands.items():
+            counts = band_distribution(period_labels(chunk['timestamp'], freq), bands)
+            counts.columns = counts.columns.astype(str)
+            self.bands[freq] = counts.add(totals, fill_value=0)[totals.columns]
+
+    def result(self) -> dict:
+        # Overall band counts
+        ths_label = self.bands['D'].sum().astype('int64')
+        ths_label = ths_label[ths_label > 0].sort_values(ascending=False)
+        ths_label = ths_label.rename_axis('transaction_health_score_label').reset_index(name='count')
+        # Band counts per day and week
+        trends = {
+            freq: fill_periods(bands.sort_index(), freq).astype('int64').rename_axis('timestamp').reset_index()
+            for freq, bands in self.bands.items()
+        }
+        return {
+            'transaction_health_score_label': ths_label,
+            'transaction_health_score_daily': trends['D'],
+            'transaction_health_score_wkly': trends['W'],
+        }
+
+
+# Metric groups by name
+METRIC_GROUPS = {
+    'rollups': RollupMetrics,
+    'kpis': KpiMetrics,
+    'reach': ReachMetrics,
+    'retention': RetentionMetrics,
+    'holders': HolderMetrics,
+    'revenue': RevenueMetrics,
+    'swaps': SwapMetrics,
+    'health': HealthMetrics,
+}
+
+# Metric key -> group name
+METRIC_KEYS = {key: name for name, group in METRIC_GROUPS.items() for key in group.keys}
+
+
+class MetricsEngine:
+    """
+    Incremental dashboard metrics.
+
+    Keeps partial aggregates and the last processed block per metric group
+    so that a dataset which only grew by higher blocks is folded in without
+    a full recompute, and groups nobody asked for are never computed.
+    """
+
+    def __init__(self, prices: PriceTable, address_book: AddressBook = None, rollup_path: str = None,
+                 distinct_error: float = None, ledger: BalanceLedger = None):
+        self.prices = prices
+        self.address_book = address_book if address_book is not None else AddressBook()
+        self.lock = threading.Lock()
+        self.first_block = None
+        self.rollups = RollupCube(prices, rollup_path)
+        # Exact distinct counts, or HyperLogLog sketches within distinct_error, and
+        # the balance ledger, which must only be fed by this engine
+        options = {'distinct_error': distinct_error, 'ledger': ledger}
+        self.groups = {name: group(self.address_book, self.rollups, **{key: options[key] for key in group.options})
+                       for name, group in METRIC_GROUPS.items()}
+        # Last prepared chunk, shared by groups at the same watermark
+        self.prepared = (None, None, None)
+        # Latest time whose fees were converted and the signature of the prices used,
+        # and whether prices changed while a chunk was converted
+        self.priced = None
+        self.stale = False
+
+    def accepts(self, dataframe: pd.DataFrame) -> bool:
+        """
+        Checks the dataframe only extends what has already been folded
+        Params:
+            dataframe: Dataframe containing the dataset
+        Returns:
+            True if the engine can be updated with the new rows
+        """
+        if self.first_block is None:
+            return True
+        # Aggregated fees were converted with prices that have since been imported or replaced
+        if self.prices_changed():
+            return False
+        index = TimeIndex(dataframe)
+        if index.blocks[0] != self.first_block:
+            return False
+        checkpoints = {group.watermark: group.row_count for group in self.groups.values()
+                       if group.watermark is not None}
+        return all(index.block_slice(end=watermark).stop == rows for watermark, rows in checkpoints.items())
+
+    def group_metrics(self, dataframe: pd.DataFrame, name: str) -> dict:
+        """
+        Folds rows above a group's watermark and returns its metrics
+        Params:
+            dataframe: Dataframe containing the dataset
+            name: metric group name
+        Returns:
+            Dictionary of the group's metrics
+        """
+        group = self.groups[name]
+        if group.uses_rollups:
+            self.group_metrics(dataframe, 'rollups')
+        if group.watermark is None:
+            group.restore(dataframe)
+        chunk = dataframe
+        if group.watermark is not None:
+            chunk = dataframe.iloc[TimeIndex(dataframe).block_slice(start=group.watermark + 1)]
+        if self.first_block is None:
+            self.first_block = dataframe['block_number'].iat[0]
+        if not chunk.empty:
+            group.fold(self.prepare(chunk, group.watermark))
+            # Move watermark
+            group.watermark = chunk['block_number'].iat[-1]
+            group.row_count += len(chunk)
+            group.cached = None
+            group.persist(self.first_block)
+        if group.cached is None:
+            group.cached = group.result()
+        return group.cached
+
+    def prepare(self, chunk: pd.DataFrame, watermark) -> pd.DataFrame:
+        """
+        Prepares a chunk once for every group folding it
+        """
+        start, end, prepared = self.prepared
+        last_block = chunk['block_number'].iat[-1]
+        if prepared is None or (start, end) != (watermark, last_block):
+            # Wallet ids, normally encoded once at load time
+            if 'from_id' not in chunk:
+                chunk = self.address_book.encode_frame(chunk.copy())
+            # Groups only use the ids, keep the cached chunk small
+            chunk = chunk.drop(columns=['from_address', 'to_address'])
+            until = chunk['timestamp'].max()
+            signature = self.prices.signature(until)
+            prepared = prepare_transactions(chunk, self.prices)
+            self.prepared = (watermark, last_block, prepared)
+            # Remember the prices used, unless earlier ones changed since or these changed meanwhile
+            if self.prices.signature(until) != signature:
+                self.stale = True
+            elif not self.prices_changed() and (self.priced is None or until >= self.priced[0]):
+                self.priced = (until, signature)
+        return prepared
+
+    def prices_changed(self) -> bool:
+        """
+        Whether the prices of times already folded changed since their fees were converted
+        """
+        if self.stale:
+            return True
+        return self.priced is not None and self.prices.signature(self.priced[0]) != self.priced[1]
+
+    def metrics(self, dataframe: pd.DataFrame) -> dict:
+        """
+        Folds every group and builds the full metrics dict
+        Params:
+            dataframe: Dataframe containing the dataset
+        Returns:
+            Dictionary containing all dashboard metrics and values
+        """
+        metrics_dict = {}
+        for name in self.groups:
+            metrics_dict.update(self.group_metrics(dataframe, name))
+        return metrics_dict
+
+
+def swap_frame(totals: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turns swap period sums into the daily / weekly / monthly swaps frame
+    """
+    frame = pd.DataFrame({
+        'total_volume': totals['amount_sum'],
+        'average_volume': totals['amount_sum'] / totals['amount_count'].replace(0, np.nan),
+        'transaction_count': totals['rows'].astype('int64'),
+        'total_fees': totals['gas_fees_usd_sum'],
+        'average_fees': totals['gas_fees_usd_sum'] / totals['gas_fees_usd_count'].replace(0, np.nan),
+    })
+    return frame.rename_axis('date').reset_index()
+
@@ -1,16 +1,26 @@
 import streamlit as st
-import requests
-from datetime import datetime
-import gspread
-import numpy as np
-from google.oauth2.service_account import Credentials
 import pandas as pd
 from datetime import datetime
 import plotly.express as px
+from etherscan import EtherscanClient, EtherscanError
+from ethprices import get_price_table
+from sheetsync import SHEET_NAME, open_sheet, upload_rows, sync_rows
+from figcache import cached_figure
 
 # Get key for etherscan
 etherscan_ky = st.secrets['etherscan_key']['api_key']
 
+@st.cache_resource
+def get_etherscan_client(api_key: str) -> EtherscanClient:
+    """
+    Etherscan client shared across reruns and sessions
+    Params:
+        api_key: api key to access etherscan
+    Returns:
+        Etherscan client
+    """
+    return EtherscanClient(api_key)
+
 def get_token_supply(api_key, contract_address)-> str:
   """
     Gets contract address token supply
@@ -20,28 +30,10 @@ def get_token_supply(api_key, contract_address)-> str:
     Returns:
         Token supply string
   """
-  url = "https://api.etherscan.io/v2/api"
-  params = {
-      "module": "stats",
-      "action": "tokensupply",
-      "contractaddress": contract_address,
-      "apikey": api_key,
-      "chainid": 1
-  }
-
   try:
-      response = requests.get(url, params=params)
-      response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-      data = response.json()
-
-      if data["status"] == "1":
-          return data["result"]  # Return token supply
-      else:
-          print(f"Error: {data['message']}")
-          return None
-
-  except requests.exceptions.RequestException as e:
-      print(f"An error occurred: {e}")
+      return get_etherscan_client(api_key).token_supply(contract_address)
+  except EtherscanError as e:
+      print(f"Error: {e}")
       return None
 
 def get_latest_eth_price(api_key: str)-> tuple:
@@ -52,28 +44,10 @@ def get_latest_eth_price(api_key: str)-> tuple:
     Returns:
         Tuple: eth_price, eth_timestamp
     """
-    url = "https://api.etherscan.io/v2/api"
-    params = {
-      "module": "stats",
-      "action": "ethprice",
-      "apikey": api_key,
-      "chainid": 1
-  }
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if data["status"] == "1":
-            eth_data = data['result']
-            eth_price = eth_data['ethusd']
-            eth_timestamp = eth_data['ethusd_timestamp']
-            return eth_price, eth_timestamp
-        else:
-            print(f"Error: {data['message']}")
-            return ()
-
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
+        return get_etherscan_client(api_key).eth_price()
+    except EtherscanError as e:
+        print(f"Error: {e}")
         return ()
 
 def get_and_format(contract_address: str = '0x6c3ea9036406852006290770BEdFcAbA0e23A0e8')-> tuple:
@@ -82,23 +56,31 @@ def get_and_format(contract_address: str = '0x6c3ea9036406852006290770BEdFcAbA0e
     Params:
         contract_address: the contract address of the token
     Returns:
-        Tuple: 
+        Tuple: token supply in millions, eth price, eth price time, each None when etherscan could not provide it
     """
-    # Get supply
-    token_supply = get_token_supply(etherscan_ky, contract_address)
-    # Get Price and Time
-    eth_price = get_latest_eth_price(etherscan_ky)
+    # Get supply, price and time in one round trip
+    token_supply, eth_price = get_etherscan_client(etherscan_ky).header(contract_address)
     # Format token supply
-    token_supply_formated = round(int(token_supply) / 10**12, 3) # Million
-    # Format eth price
-    eth_price_formated = round(float(eth_price[0]), 3)
-    # Format eth price timestamp
-    eth_timestamp_formated = datetime.fromtimestamp(int(eth_price[1])).strftime("%B %d, %Y %H:%M")
+    token_supply_formated = None
+    if isinstance(token_supply, Exception):
+        print(f"Error: {token_supply}")
+    else:
+        token_supply_formated = round(int(token_supply) / 10**12, 3) # Million
+    # Format eth price and timestamp
+    eth_price_formated, eth_timestamp_formated = None, None
+    if isinstance(eth_price, Exception):
+        print(f"Error: {eth_price}")
+    else:
+        eth_price_formated = round(float(eth_price[0]), 3)
+        # Extend the price history gas fees are converted with
+        get_price_table().record(float(eth_price[0]), int(eth_price[1]))
+        eth_timestamp_formated = datetime.fromtimestamp(int(eth_price[1])).strftime("%B %d, %Y %H:%M")
 
     # Return
     return token_supply_formated, eth_price_formated, eth_timestamp_formated
 
 
+@cached_figure
 def make_line_plots(df: pd.DataFrame,
                     y_col: str,
                     title: str,
@@ -106,7 +88,8 @@ def make_line_plots(df: pd.DataFrame,
                     var_name: str,
                     value_name: str,
                     y_axis_title: str,
-                    multicols: bool=False) -> px.line:
+                    multicols: bool=False,
+                    colors: list=None) -> px.line:
     """
     Makes a plotly line plot
     Params:
@@ -116,7 +99,8 @@ def make_line_plots(df: pd.DataFrame,
         multi_vars: list,
         var_name: str,
         value_name: str,
-        multicols: bool=False
+        multicols: bool=False,
+        colors: line colors for multicols, defaults to two colors
     Returns:
         Plotly object
     """
@@ -134,7 +118,7 @@ def make_line_plots(df: pd.DataFrame,
             color=var_name,
             y=value_name,
             markers=True,
-            color_discrete_sequence=['#10EEEE', '#ff6347'],
+            color_discrete_sequence=colors or ['#10EEEE', '#ff6347'],
             title=title
         )
         
@@ -163,6 +147,7 @@ def make_line_plots(df: pd.DataFrame,
         fig.update_yaxes(showgrid=False)
     return fig
 
+@cached_figure
 def make_bar(df: pd.DataFrame, x_col: str,
              y_col: str,
              title: str,
@@ -203,82 +188,103 @@ def make_bar(df: pd.DataFrame, x_col: str,
     return fig
 
 
-def upload_sheets(df: pd.DataFrame):
+@cached_figure
+def make_heatmap(rates: pd.DataFrame, unit: str) -> px.imshow:
     """
-    Uploads whole dataframe to google sheets
+    Makes the wallet retention heatmap
     Params:
-        df: Dataframe containing pyusd data
+        rates: retention rate per cohort (rows) and periods since first seen (columns)
+        unit: cohort period name, e.g. Week
+    Returns:
+        Plotly object
     """
-    # Define the scope and authorize the service account
-    SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    CREDS = Credentials.from_service_account_info(st.secrets['gcp_service_account'], scopes=SCOPES)
-    # Auth
-    gc = gspread.authorize(CREDS)
+    # Create fig
+    fig = px.imshow(
+        rates.values,
+        labels=dict(x=f"{unit}s Since First Seen", y=f"Cohort {unit}", color="Retention Rate"),
+        x=rates.columns,
+        y=rates.index.strftime('%B %d, %Y'),
+        color_continuous_scale='Blues',
+        aspect='auto',
+        text_auto=True
+    )
+    fig.update_layout(title="Wallet Retention Heatmap",
+                      xaxis_title=f"{unit}s Since First Seen",
+                      yaxis_title=f"Cohort {unit}")
+    return fig
+
 
-    # Clean df timestamp for sheets
-    # df['timestamp'] = pd.to_datetime(df['timestamp'])
-    # df['timestamp'] = df['timestamp'].dt.date
-    # df.rename(columns={'timestamp': 'date'}, inplace=True)
-    # df['date'] = df['date'].astype(str)
-    # df.sort_values(by='date', ascending=True, inplace=True)
+@cached_figure
+def make_pie(counts: pd.Series, title: str) -> px.pie:
+    """
+    Makes a donut chart
+    Params:
+        counts: values indexed by name
+        title: str
+    Returns:
+        Plotly object
+    """
+    # Create fig
+    fig = px.pie(
+        names=counts.index,
+        values=counts.values,
+        hole=.6,
+        title=title,
+        color_discrete_sequence=['#10EEEE', '#ff6347']
+    )
+    return fig
 
-    # Open the Google Sheet
-    SHEET_NAME = "PYUSD SHEETS"
 
+def upload_sheets(df: pd.DataFrame):
+    """
+    Uploads whole dataframe to google sheets in chunks, resuming an interrupted upload
+    Params:
+        df: Dataframe containing pyusd data
+    """
     # Open spreadsheet
     try:
-        my_sheet = gc.open(SHEET_NAME).sheet1
+        my_sheet = open_sheet()
     except Exception as e:
         print(f'Error: {e}')
         st.error('Failed to open sheet')
+        return
 
-    # Upload Data to spreadsheet
+    # Upload Data to spreadsheet, one chunk per request
+    progress = st.progress(0.0, text=f'Uploading to {SHEET_NAME}')
     try:
-        my_sheet.update(range_name='A2', values=df.values.tolist(), raw=False)
+        upload_rows(my_sheet, df, on_chunk=lambda done, total: progress.progress(
+            done / total, text=f'Uploaded {done:,} of {total:,} rows'))
         print(f'\n {SHEET_NAME} successfully update')
         # Toast
         st.toast(f'{SHEET_NAME} successfully uploaded')
     except Exception as e:
         print(f'Error: {e}')
+        st.error('Upload interrupted, uploading again resumes from the last chunk')
 
 
-def append_sheets(df: pd.DataFrame):
+def sync_sheets(df: pd.DataFrame):
     """
-    Appends most recent roUplows to google sheets
+    Appends rows added since the last sync to google sheets
     Params:
-        df: Dataframe containing pyusd data
+        df: Dataframe containing the full pyusd history
     """
-    # Define the scope and authorize the service account
-    SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    CREDS = Credentials.from_service_account_info(st.secrets['gcp_service_account'], scopes=SCOPES)
-    # Auth
-    gc = gspread.authorize(CREDS)
-
-    # Open the Google Sheet
-    SHEET_NAME = "PYUSD SHEETS"
-    
     # Open spreadsheet
     try:
-        sheet = gc.open(SHEET_NAME).sheet1
+        sheet = open_sheet()
     except Exception as e:
         print(f'Error: {e}')
         st.error('Failed to open sheet')
+        return
 
-    # Get last row in sheets
-    last_row = sheet.row_count
-    # Get latest block
-    latest_block = sheet.cell(last_row, 2).value
-    print(latest_block)
-
-    # check if latest block matches
-    if df['block_number'].max() == latest_block:
-        st.warning('Sheet is up-to-date')
-    elif df['block_number'].max() > latest_block:
-        # Subset most recent data
-        df = df[df['block_number'] > latest_block]    
-        # Append future data to sheets
-        try:
-            sheet.append_rows(df.values.tolist(), value_input_option='USER_ENTERED')
-            st.toast(f'\n {SHEET_NAME} successfully appended')
-        except Exception as e:
-            print(f'Error: {e}')
+    # Append rows after the watermark, one chunk per request
+    progress = st.progress(0.0, text=f'Syncing {SHEET_NAME}')
+    try:
+        synced = sync_rows(sheet, df, on_chunk=lambda done, total: progress.progress(
+            done / total, text=f'Synced {done:,} of {total:,} new rows'))
+        if synced:
+            st.toast(f'\n {SHEET_NAME} successfully appended {synced:,} rows')
+        else:
+            st.warning('Sheet is up-to-date')
+    except Exception as e:
+        print(f'Error: {e}')
+        st.error('Sync interrupted, syncing again continues from the last chunk')
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+
+# Cohort frequency -> index and column names of the retention table
+PERIOD_NAMES = {
+    'D': ('cohort_day', 'days_since_cohort'),
+    'W': ('cohort_week', 'weeks_since_cohort'),
+    'ME': ('cohort_month', 'months_since_cohort'),
+}
+
+
+def period_numbers(timestamps, freq: str) -> np.ndarray:
+    """
+    Numbers periods so that consecutive periods differ by one
+    Params:
+        timestamps: datetime array-like
+        freq: one of D, W (weeks start on monday), ME
+    Returns:
+        int64 array of period numbers
+    """
+    timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+    if freq == 'ME':
+        return timestamps.astype('datetime64[M]').astype(np.int64)
+    days = timestamps.astype('datetime64[D]').astype(np.int64)
+    if freq == 'W':
+        # 1970-01-01 is a thursday, shift so weeks start on monday
+        return (days + 3) // 7
+    return days
+
+
+def period_starts(numbers, freq: str) -> pd.DatetimeIndex:
+    """
+    First day of numbered periods, the inverse of period_numbers
+    """
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if freq == 'ME':
+        return pd.DatetimeIndex(numbers.astype('datetime64[M]').astype('datetime64[ns]'))
+    if freq == 'W':
+        numbers = numbers * 7 - 3
+    return pd.DatetimeIndex(numbers.astype('datetime64[D]').astype('datetime64[ns]'))
+
+
+class Bitset:
+    """
+    Packed set of wallet ids.
+
+    Only the bytes between the lowest and highest id are stored. Ids are
+    handed out in first seen order, so a cohort occupies a narrow id range
+    and stays small however many wallets came before it.
+    """
+
+    def __init__(self, offset: int = 0, bits: np.ndarray = None):
+        self.offset = offset
+        self.bits = bits if bits is not None else np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def from_ids(cls, ids) -> 'Bitset':
+        """
+        Builds a bitset from an array of ids
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return cls()
+        offset = int(ids.min()) // 8
+        flags = np.zeros((int(ids.max()) // 8 - offset + 1) * 8, dtype=bool)
+        flags[ids - offset * 8] = True
+        return cls(offset, np.packbits(flags, bitorder='little'))
+
+    @property
+    def end(self) -> int:
+        return self.offset + len(self.bits)
+
+    def __len__(self) -> int:
+        return int(np.bitwise_count(self.bits).sum())
+
+    def widen(self, offset: int, end: int) -> np.ndarray:
+        """
+        Copies the bits onto a byte range covering this bitset
+        """
+        bits = np.zeros(end - offset, dtype=np.uint8)
+        bits[self.offset - offset:self.end - offset] = self.bits
+        return bits
+
+    def __or__(self, other: 'Bitset') -> 'Bitset':
+        if not len(other.bits):
+            return self
+        if not len(self.bits):
+            return other
+        offset, end = min(self.offset, other.offset), max(self.end, other.end)
+        bits = self.widen(offset, end)
+        bits[other.offset - offset:other.end - offset] |= other.bits
+        return Bitset(offset, bits)
+
+    def overlap(self, other: 'Bitset') -> tuple:
+        """
+        Slices of both bitsets over their common byte range
+        """
+        offset, end = max(self.offset, other.offset), min(self.end, other.end)
+        if end <= offset:
+            return self.bits[:0], other.bits[:0]
+        return (self.bits[offset - self.offset:end - self.offset],
+                other.bits[offset - other.offset:end - other.offset])
+
+    def __sub__(self, other: 'Bitset') -> 'Bitset':
+        bits = self.bits.copy()
+        mine, theirs = self.overlap(other)
+        if len(mine):
+            start = max(self.offset, other.offset) - self.offset
+            bits[start:start + len(mine)] &= ~theirs
+        return Bitset(self.offset, bits)
+
+    def intersection_size(self, other: 'Bitset') -> int:
+        """
+        Number of ids in both bitsets
+        """
+        mine, theirs = self.overlap(other)
+        return int(np.bitwise_count(mine & theirs).sum())
+
+
+class CohortRetention:
+    """
+    Cohort x periods since cohort counts of active wallets.
+
+    Each period's active wallets are kept as a bitset over wallet ids. A
+    cohort is the period's active wallets minus every wallet seen before it,
+    and a cell of the table is the size of the intersection of a cohort with
+    a later period. Only periods touched by a fold are recomputed.
+    """
+
+    def __init__(self, freq: str = 'W'):
+        self.freq = freq
+        self.active = {}
+        self.cohorts = {}
+        self.counts = {}
+        self.dirty = None
+
+    def fold(self, wallets, timestamps):
+        """
+        Adds wallet activity
+        Params:
+            wallets: wallet ids
+            timestamps: time of each activity
+        """
+        periods = period_numbers(timestamps, self.freq)
+        if len(periods) == 0:
+            return
+        wallets = np.asarray(wallets)
+        order = np.argsort(periods, kind='stable')
+        periods, wallets = periods[order], wallets[order]
+        labels, starts = np.unique(periods, return_index=True)
+        for period, ids in zip(labels.tolist(), np.split(wallets, starts[1:])):
+            self.active[period] = self.active.get(period, Bitset()) | Bitset.from_ids(ids)
+        first = int(labels[0])
+        self.dirty = first if self.dirty is None else min(self.dirty, first)
+
+    def update(self):
+        """
+        Recomputes cohorts and counts from the first period touched since the last update
+        """
+        if self.dirty is None:
+            return
+        dirty = self.dirty
+        self.counts = {key: n for key, n in self.counts.items() if key[0] < dirty and key[1] < dirty}
+        seen = Bitset()
+        for period in sorted(self.cohorts):
+            if period < dirty:
+                seen = seen | self.cohorts[period]
+            else:
+                del self.cohorts[period]
+        periods = sorted(self.active)
+        for period in periods:
+            if period >= dirty:
+                self.cohorts[period] = self.active[period] - seen
+                seen = seen | self.cohorts[period]
+        # Cells with a period touched since the last update
+        for cohort, members in self.cohorts.items():
+            for period in periods:
+                if period >= cohort and (cohort, period) not in self.counts:
+                    self.counts[(cohort, period)] = members.intersection_size(self.active[period])
+        self.dirty = None
+
+    def table(self) -> pd.DataFrame:
+        """
+        Retention table
+        Returns:
+            Dataframe of active wallet counts indexed by cohort start with one column per periods since cohort
+        """
+        self.update()
+        cohort_name, since_name = PERIOD_NAMES[self.freq]
+        counts = {key: n for key, n in self.counts.items() if n}
+        keys = np.array(list(counts), dtype=np.int64).reshape(-1, 2)
+        cells = pd.Series(list(counts.values()), dtype='int64',
+                          index=pd.MultiIndex.from_arrays([period_starts(keys[:, 0], self.freq),
+                                                           keys[:, 1] - keys[:, 0]]))
+        table = cells.unstack(fill_value=0).sort_index()
+        table.index.name = cohort_name
+        table.columns.name = since_name
+        return table
+
+
+def retention_rate(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Share of each cohort active in the periods after it
+    Params:
+        table: retention table, see CohortRetention.table
+    Returns:
+        Dataframe of percentages rounded to 2 decimals
+    """
+    return round(table.divide(table[0], axis=0) * 100, 2)
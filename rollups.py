@@ -0,0 +1,158 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ethprices import PriceTable
+
+# Resample frequency -> date_range frequency
+RANGE_FREQ = {'h': 'h', 'D': 'D', 'W': 'W-SUN', 'ME': 'ME'}
+
+# Columns summed by the cube, fees in usd are priced and rounded per row
+# like every other fee metric, so the cube records the prices it used
+MEASURES = ['amount', 'gas_fees_usd']
+
+
+def period_labels(timestamps: pd.Series, freq: str) -> pd.Series:
+    """
+    Labels timestamps with the bin pandas resample would put them in
+    Params:
+        timestamps: datetime series
+        freq: one of h, D, W, ME
+    Returns:
+        Series of bin labels
+    """
+    if freq in ('h', 'D'):
+        return timestamps.dt.floor(freq)
+    days = timestamps.dt.normalize()
+    if freq == 'W':
+        # Weeks end on sunday and are labelled by it
+        return days + pd.to_timedelta(6 - days.dt.weekday, unit='D')
+    return days + pd.offsets.MonthEnd(0)
+
+
+def fill_periods(frame, freq: str, fill_value=0):
+    """
+    Reindexes a period indexed frame over every bin between its first and last label
+    """
+    if frame.empty:
+        return frame
+    index = pd.date_range(frame.index.min(), frame.index.max(), freq=RANGE_FREQ[freq])
+    return frame.reindex(index, fill_value=fill_value)
+
+
+class RollupCube:
+    """
+    Hour x dex x category rollup of row counts, sums and non-null counts.
+
+    Transactions are grouped once at the finest grain. Coarser frequencies
+    and dex / category slices are derived from the hourly base, since sums
+    and counts merge by addition and means are sum / count. The base can be
+    persisted as a materialized table next to the dataset.
+    """
+
+    def __init__(self, prices: PriceTable, path: str = None, measures: list = MEASURES):
+        self.prices = prices
+        self.path = path
+        self.measures = measures
+        names = ['rows'] + [f'{c}_{s}' for c in measures for s in ('sum', 'count')]
+        index = pd.MultiIndex.from_arrays([pd.DatetimeIndex([]), [], []], names=['hour', 'dex', 'category'])
+        self.base = pd.DataFrame(index=index, columns=names, dtype='float64')
+
+    def fold(self, chunk: pd.DataFrame, dex: pd.Series):
+        """
+        Adds transactions to the hourly base
+        Params:
+            chunk: prepared transactions
+            dex: dex name of each transaction, NaN when not a swap
+        """
+        keys = [period_labels(chunk['timestamp'], 'h').values,
+                dex.fillna('').values,
+                np.where(dex.notna(), 'swap', 'transfer')]
+        grouped = chunk[self.measures].groupby(keys)
+        base = pd.concat([grouped.size().rename('rows'),
+                          grouped.sum().add_suffix('_sum'),
+                          grouped.count().add_suffix('_count')], axis=1)
+        base.index.names = self.base.index.names
+        self.base = base.add(self.base, fill_value=0)[self.base.columns]
+
+    def rollup(self, freq: str, dex: str = None, category: str = None) -> pd.DataFrame:
+        """
+        Derives a period series from the hourly base
+        Params:
+            freq: one of h, D, W, ME
+            dex: only this dex when given
+            category: only this category (swap, transfer) when given
+        Returns:
+            Dataframe indexed by period with rows, sums and counts, empty periods filled with 0
+        """
+        base = self.base
+        if dex is not None:
+            base = base[base.index.get_level_values('dex') == dex]
+        if category is not None:
+            base = base[base.index.get_level_values('category') == category]
+        hours = base.index.get_level_values('hour')
+        totals = base.groupby(period_labels(hours.to_series(index=base.index), freq).values).sum()
+        return fill_periods(totals.sort_index(), freq)
+
+    def dex_counts(self) -> pd.Series:
+        """
+        Number of swaps per dex
+        """
+        swaps = self.base[self.base.index.get_level_values('category') == 'swap']
+        return swaps['rows'].groupby(level='dex').sum().astype('int64')
+
+    def priced_until(self) -> pd.Timestamp:
+        """
+        End of the last hour in the base, no folded fee is later
+        """
+        if self.base.empty:
+            return pd.Timestamp(0)
+        return self.base.index.get_level_values('hour').max() + pd.Timedelta(hours=1)
+
+    def prices_changed(self, meta: dict) -> bool:
+        """
+        Whether the prices of the fees in a materialized table changed since it was saved
+        Params:
+            meta: watermark details read from the table
+        """
+        if 'prices' not in meta:
+            return True
+        return self.prices.signature(pd.Timestamp(meta['priced_until'])) != meta['prices']
+
+    def save(self, **meta):
+        """
+        Writes the hourly base to the materialized table
+        Params:
+            meta: watermark details stored with the table
+        """
+        # The fees are in usd, record which prices they were converted with
+        until = self.priced_until()
+        meta = {**meta, 'priced_until': until.isoformat(), 'prices': self.prices.signature(until)}
+        table = pa.Table.from_pandas(self.base.reset_index(), preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b'rollup': json.dumps(meta).encode()})
+        # Write next to the target and rename so readers never see a partial file
+        tmp_path = f'{self.path}.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> dict:
+        """
+        Reads the hourly base from the materialized table
+        Returns:
+            Watermark details stored with the table, None if there is no table
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        table = pq.read_table(self.path)
+        self.base = table.to_pandas().set_index(self.base.index.names)[self.base.columns]
+        return json.loads(table.schema.metadata[b'rollup'])
+
+    def read_meta(self) -> dict:
+        """
+        Reads only the watermark details of the materialized table
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        return json.loads(pq.read_schema(self.path).metadata[b'rollup'])
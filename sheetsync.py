@@ -0,0 +1,246 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from datastore import SCHEMA, SHEETS_PROGRESS_PATH, SHEETS_WATERMARK_PATH
+from timeindex import TimeIndex
+
+# Spreadsheet the dataset is exported to
+SHEET_NAME = 'PYUSD SHEETS'
+SCOPES = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+# Dataset columns, in sheet order
+SHEET_COLUMNS = SCHEMA.names
+# Rows per request, well under the sheets request size limit
+CHUNK_ROWS = 5000
+# Sheets allows 60 write requests per minute per user
+MIN_INTERVAL = 1.0
+# Quota and transient server errors are retried with exponential backoff
+RETRY_STATUS = (429, 500, 502, 503)
+MAX_RETRIES = 6
+MAX_DELAY = 64.0
+
+
+def open_sheet(client=None):
+    """
+    Opens the first worksheet of the export spreadsheet
+    Params:
+        client: gspread client, or any object with open(name).sheet1, authorized from the app secrets when None
+    Returns:
+        Worksheet
+    """
+    if client is None:
+        import gspread
+        import streamlit as st
+        from google.oauth2.service_account import Credentials
+        creds = Credentials.from_service_account_info(st.secrets['gcp_service_account'], scopes=SCOPES)
+        client = gspread.authorize(creds)
+    return client.open(SHEET_NAME).sheet1
+
+
+def status_code(error: Exception):
+    """
+    HTTP status of a gspread APIError, None for other errors
+    """
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def sheet_rows(chunk: pd.DataFrame) -> list:
+    """
+    Converts rows to sheet values, timestamps as strings
+    """
+    return chunk[SHEET_COLUMNS].astype({'timestamp': str}).values.tolist()
+
+
+class SheetWriter:
+    """
+    Sends requests to a worksheet at a bounded rate.
+
+    Requests are spaced at least min_interval seconds apart, and quota or
+    server errors are retried with exponential backoff. The clock and
+    sleep are injectable so the writer runs against a fake worksheet
+    without waiting.
+    """
+
+    def __init__(self, worksheet, min_interval: float = MIN_INTERVAL, max_retries: int = MAX_RETRIES,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.worksheet = worksheet
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self.last_request = None
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Calls a worksheet method, waiting out the rate limit and retrying quota errors
+        Params:
+            method: worksheet method name, e.g. update
+        Returns:
+            The method's result
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.last_request is not None:
+                wait = self.last_request + self.min_interval - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+            self.last_request = self.clock()
+            try:
+                return getattr(self.worksheet, method)(*args, **kwargs)
+            except Exception as e:
+                if status_code(e) not in RETRY_STATUS or attempt == self.max_retries:
+                    raise
+                delay = min(2 ** attempt, MAX_DELAY)
+                print(f'Sheets returned {status_code(e)}, retrying in {delay:.0f}s')
+                self.sleep(delay)
+
+
+def upload_signature(df: pd.DataFrame) -> dict:
+    """
+    Identifies an upload, a stored progress only resumes the same rows
+    """
+    return {'rows': len(df), 'columns': SHEET_COLUMNS,
+            'first_block': int(df['block_number'].iat[0]) if len(df) else None,
+            'last_block': int(df['block_number'].iat[-1]) if len(df) else None}
+
+
+def read_state(path: str) -> dict:
+    """
+    Stored upload progress or sync watermark, None if there is none
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_state(path: str, state: dict):
+    """
+    Stores upload progress or sync watermark, replacing the file atomically
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def upload_rows(worksheet, df: pd.DataFrame, progress_path: str = SHEETS_PROGRESS_PATH,
+                watermark_path: str = SHEETS_WATERMARK_PATH, chunk_rows: int = CHUNK_ROWS,
+                on_chunk=None, writer: SheetWriter = None) -> int:
+    """
+    Uploads a dataframe below the header row in chunks, resuming an interrupted upload
+    Params:
+        worksheet: gspread worksheet, or any object with update and resize
+        df: Dataframe containing pyusd data, sorted by block number and timestamp
+        progress_path: file recording the rows already written
+        watermark_path: file recording the last row synced, set to the last row uploaded
+        chunk_rows: rows per request
+        on_chunk: called with (rows written, total rows) after each chunk
+        writer: request writer, a rate limited SheetWriter on the worksheet when None
+    Returns:
+        Number of rows written by this call
+    """
+    writer = writer or SheetWriter(worksheet)
+    signature = upload_signature(df)
+    progress = read_state(progress_path)
+    # Resume only the same upload
+    if progress is not None and progress['signature'] == signature:
+        done = progress['done']
+    else:
+        done = 0
+        # Size the sheet to the data, dropping rows left from a longer upload
+        writer.call('resize', rows=len(df) + 1)
+        write_state(progress_path, {'signature': signature, 'done': done})
+
+    start = done
+    while done < len(df):
+        # Only one chunk is converted at a time
+        values = sheet_rows(df.iloc[done:done + chunk_rows])
+        writer.call('update', range_name=f'A{done + 2}', values=values, raw=False)
+        done += len(values)
+        write_state(progress_path, {'signature': signature, 'done': done})
+        if on_chunk is not None:
+            on_chunk(done, len(df))
+    # Finished, the next upload starts over and syncs continue after the last row
+    if len(df):
+        write_state(watermark_path, make_watermark(df, TimeIndex(df), len(df) - 1, len(df)))
+    os.remove(progress_path)
+    return done - start
+
+
+def make_watermark(df: pd.DataFrame, index: TimeIndex, position: int, rows: int) -> dict:
+    """
+    Identifies the last row synced
+    Params:
+        df: Dataframe containing pyusd data, sorted by block number and timestamp
+        index: time index of df
+        position: position of the last row synced
+        rows: number of data rows in the sheet
+    Returns:
+        Dict: block, tx_hash and position within the block of the row, sheet rows
+    """
+    block = int(df['block_number'].iat[position])
+    return {'block': block, 'tx_hash': df['tx_hash'].iat[position],
+            'block_offset': position - index.block_slice(block, block).start, 'rows': rows}
+
+
+def sync_start(df: pd.DataFrame, index: TimeIndex, watermark: dict) -> int:
+    """
+    Position of the first row after the watermark
+    Params:
+        df: Dataframe containing pyusd data, sorted by block number and timestamp
+        index: time index of df
+        watermark: see make_watermark
+    Returns:
+        Row position, len(df) when there are no new rows
+    """
+    # Rows of the watermark block, found by binary search
+    rows = index.block_slice(watermark['block'], watermark['block'])
+    hashes = df['tx_hash'].iloc[rows].to_numpy()
+    offset = watermark['block_offset']
+    if offset < len(hashes) and hashes[offset] == watermark['tx_hash']:
+        return rows.start + offset + 1
+    # Block reordered, continue after the last row of the transaction
+    matches = np.flatnonzero(hashes == watermark['tx_hash'])
+    return rows.start + int(matches[-1]) + 1 if len(matches) else rows.stop
+
+
+def sync_rows(worksheet, df: pd.DataFrame, watermark_path: str = SHEETS_WATERMARK_PATH,
+              progress_path: str = SHEETS_PROGRESS_PATH, chunk_rows: int = CHUNK_ROWS,
+              on_chunk=None, writer: SheetWriter = None) -> int:
+    """
+    Appends the rows after the last synced row, uploading everything when nothing was synced yet
+    Params:
+        worksheet: gspread worksheet, or any object with update and resize
+        df: Dataframe containing the full pyusd history, sorted by block number and timestamp
+        watermark_path: file recording the last row synced
+        progress_path: file recording the rows written by a full upload
+        chunk_rows: rows per request
+        on_chunk: called with (rows written, new rows) after each chunk
+        writer: request writer, a rate limited SheetWriter on the worksheet when None
+    Returns:
+        Number of rows written
+    """
+    watermark = read_state(watermark_path)
+    if watermark is None:
+        return upload_rows(worksheet, df, progress_path, watermark_path, chunk_rows, on_chunk, writer)
+    writer = writer or SheetWriter(worksheet)
+    index = TimeIndex(df)
+    start = sync_start(df, index, watermark)
+    new = df.iloc[start:]
+    if new.empty:
+        return 0
+
+    # Rows are written at fixed positions after the watermark, so a retried
+    # chunk overwrites the same cells instead of appending them twice
+    rows = watermark['rows']
+    writer.call('resize', rows=rows + len(new) + 1)
+    for offset in range(0, len(new), chunk_rows):
+        values = sheet_rows(new.iloc[offset:offset + chunk_rows])
+        writer.call('update', range_name=f'A{rows + 2}', values=values, raw=False)
+        rows += len(values)
+        write_state(watermark_path, make_watermark(df, index, start + offset + len(values) - 1, rows))
+        if on_chunk is not None:
+            on_chunk(offset + len(values), len(new))
+    return len(new)
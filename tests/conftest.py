@@ -0,0 +1,29 @@
+import contextlib
+import os
+import sys
+import pytest
+from aiohttp import web
+
+# Modules are imported from the repository root, as the app runs them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    """
+    Runs an aiohttp handler on a free local port, used as async with serve(handler) as url
+    """
+    @contextlib.asynccontextmanager
+    async def start(handler):
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        try:
+            host, port = runner.addresses[0][:2]
+            yield f'http://{host}:{port}/'
+        finally:
+            await runner.cleanup()
+    return start
@@ -0,0 +1,72 @@
+import os
+import threading
+import pandas as pd
+from datastore import append_batches, append_csv, current_version, max_block, migrate_store, read_dataset, to_table
+
+
+def transfers(blocks: list) -> pd.DataFrame:
+    """
+    One transfer per block, an hour apart
+    """
+    return pd.DataFrame({
+        'tx_hash': [f'0x{block:064x}' for block in blocks],
+        'block_number': blocks,
+        'timestamp': [pd.Timestamp('2025-03-01') + pd.Timedelta(hours=block - 1000) for block in blocks],
+        'from_address': '0x' + 'a' * 40,
+        'to_address': '0x' + 'b' * 40,
+        'amount': [float(block) for block in blocks],
+        'gas_fees_eth': 0.0005,
+    })
+
+
+def write_csv(path, blocks: list):
+    frame = transfers(blocks)
+    frame['timestamp'] = frame['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S+00:00')
+    frame.to_csv(path, index=False)
+
+
+def test_append_csv_adds_only_rows_above_the_stored_blocks(tmp_path):
+    path = os.path.join(tmp_path, 'pyusd.parquet')
+    csv_path = os.path.join(tmp_path, 'pyusd.csv')
+    write_csv(csv_path, list(range(1000, 1030)))
+    assert append_csv(csv_path, path) == 30
+
+    # The latest export repeats the stored blocks, its rows are not sorted by block
+    blocks = list(range(1000, 1060))
+    write_csv(csv_path, blocks[::-1][::2] + blocks[::-1][1::2])
+    assert append_csv(csv_path, path) == 30
+    stored = read_dataset(path)
+    assert sorted(stored['block_number']) == blocks
+    assert max_block(path) == 1059
+    assert stored['timestamp'].iloc[0] == pd.Timestamp('2025-03-01')
+
+    # Nothing new, no version is published
+    version = current_version(path)
+    assert append_csv(csv_path, path) == 0
+    assert current_version(path) == version
+
+
+def test_append_csv_reads_small_blocks_of_the_csv(tmp_path):
+    path = os.path.join(tmp_path, 'pyusd.parquet')
+    csv_path = os.path.join(tmp_path, 'pyusd.csv')
+    write_csv(csv_path, list(range(1000, 1500)))
+    assert append_csv(csv_path, path, block_size=4096, flush_rows=100) == 500
+    assert read_dataset(path)['block_number'].tolist() == list(range(1000, 1500))
+
+
+def test_concurrent_writers_keep_every_row(tmp_path):
+    path = os.path.join(tmp_path, 'pyusd.parquet')
+
+    def write(first):
+        for start in range(first, first + 50, 10):
+            append_batches([to_table(transfers(list(range(start, start + 10))))], path)
+            migrate_store(path, csv_path=None)
+
+    threads = [threading.Thread(target=write, args=(first,)) for first in range(1000, 1200, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(read_dataset(path)['block_number']) == list(range(1000, 1200))
+    # Every temporary directory was published or removed
+    assert not [entry for entry in os.listdir(tmp_path) if '.tmp' in entry]
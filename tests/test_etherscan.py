@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from etherscan import CircuitBreaker, EtherscanClient, EtherscanUnavailable
+
+PYUSD = '0x6c3ea9036406852006290770bedfcaba0e23a0e8'
+
+
+class FakeEtherscan(ThreadingHTTPServer):
+    """
+    Etherscan api answering in its own thread, the client blocks on its own loop
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeHandler)
+        self.actions = []
+        self.delay = 0.0
+        self.failing = False
+        self.price = 1800
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/v2/api'
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        action = parse_qs(urlparse(self.path).query)['action'][0]
+        server.actions.append(action)
+        time.sleep(server.delay)
+        if server.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if action == 'ethprice':
+            result = {'ethusd': str(server.price), 'ethusd_timestamp': '1700000000'}
+        else:
+            result = '123000000000000'
+        body = json.dumps({'status': '1', 'message': 'OK', 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def etherscan():
+    server = FakeEtherscan()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_values_are_cached_for_the_ttl(etherscan):
+    client = EtherscanClient('key', base_url=etherscan.url, ttl=60)
+    assert client.eth_price() == ('1800', '1700000000')
+    etherscan.price = 1900
+    assert client.eth_price() == ('1800', '1700000000')
+    assert etherscan.actions == ['ethprice']
+
+
+def test_header_fetches_both_values_concurrently(etherscan):
+    etherscan.delay = 0.3
+    client = EtherscanClient('key', base_url=etherscan.url)
+    started = time.monotonic()
+    supply, price = client.header(PYUSD)
+    assert supply == '123000000000000'
+    assert price == ('1800', '1700000000')
+    assert time.monotonic() - started < 0.55
+    assert sorted(etherscan.actions) == ['ethprice', 'tokensupply']
+
+
+def test_stale_values_are_served_while_they_refresh(etherscan):
+    client = EtherscanClient('key', base_url=etherscan.url, ttl=0.1)
+    assert client.eth_price()[0] == '1800'
+    time.sleep(0.15)
+    etherscan.price = 1900
+    etherscan.delay = 0.3
+    # The stale value comes back at once, the refresh runs in the background
+    started = time.monotonic()
+    assert client.eth_price()[0] == '1800'
+    assert time.monotonic() - started < 0.2
+    wait_until(lambda: not client.refreshing)
+    assert client.eth_price()[0] == '1900'
+
+
+def test_last_known_value_is_kept_when_a_refresh_fails(etherscan):
+    client = EtherscanClient('key', base_url=etherscan.url, ttl=0.1)
+    assert client.eth_price()[0] == '1800'
+    time.sleep(0.15)
+    etherscan.failing = True
+    assert client.eth_price()[0] == '1800'
+    wait_until(lambda: not client.refreshing)
+    assert client.eth_price()[0] == '1800'
+
+
+def test_requests_past_the_deadline_fail(etherscan):
+    etherscan.delay = 1.0
+    client = EtherscanClient('key', base_url=etherscan.url, deadline=0.2)
+    started = time.monotonic()
+    with pytest.raises(EtherscanUnavailable, match='TimeoutError'):
+        client.eth_price()
+    assert time.monotonic() - started < 0.8
+
+
+def test_circuit_opens_and_recovers(etherscan):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    client = EtherscanClient('key', base_url=etherscan.url, breaker=breaker)
+    etherscan.failing = True
+    for _ in range(2):
+        with pytest.raises(EtherscanUnavailable, match='ClientResponseError'):
+            client.eth_price()
+    assert breaker.state == 'open'
+
+    # Open, requests fail without reaching etherscan
+    with pytest.raises(EtherscanUnavailable, match='circuit open'):
+        client.eth_price()
+    assert len(etherscan.actions) == 2
+
+    # Half-open, a failed trial opens the circuit again
+    now[0] += 30
+    assert breaker.state == 'half-open'
+    with pytest.raises(EtherscanUnavailable, match='ClientResponseError'):
+        client.eth_price()
+    assert breaker.state == 'open'
+    assert len(etherscan.actions) == 3
+
+    # A successful trial closes it
+    now[0] += 30
+    etherscan.failing = False
+    assert client.eth_price() == ('1800', '1700000000')
+    assert breaker.state == 'closed'
+    assert client.token_supply(PYUSD) == '123000000000000'
@@ -0,0 +1,74 @@
+import os
+import pandas as pd
+from ethprices import PriceTable
+from metricsengine import MetricsEngine
+
+
+def transfers(hours: int) -> pd.DataFrame:
+    """
+    One transfer an hour from March 1st, between a few wallets
+    """
+    return pd.DataFrame({
+        'tx_hash': [f'0x{i:064x}' for i in range(hours)],
+        'block_number': range(1000, 1000 + hours),
+        'timestamp': pd.date_range('2025-03-01', periods=hours, freq='h'),
+        'from_address': [f'0x{i % 5:040x}' for i in range(hours)],
+        'to_address': [f'0x{i % 7 + 5:040x}' for i in range(hours)],
+        'amount': 100.0,
+        'gas_fees_eth': 0.001,
+    })
+
+
+def test_tables_sharing_a_file_keep_each_others_prices(tmp_path):
+    path = os.path.join(tmp_path, 'eth_prices.parquet')
+    csv_path = os.path.join(tmp_path, 'history.csv')
+    app = PriceTable.load(path)
+    assert app.record(1800.0, pd.Timestamp('2025-03-10'))
+
+    # The import cli saves history while the app holds its own table
+    pd.DataFrame({'timestamp': ['2025-03-01T00:00:00Z', '2025-03-05T00:00:00Z'],
+                  'eth_usd': [1700.0, 1750.0]}).to_csv(csv_path, index=False)
+    assert PriceTable.load(path).import_csv(csv_path) == 2
+
+    # The next live price is added to the saved table, not to the app's stale copy
+    assert app.record(1850.0, pd.Timestamp('2025-03-11'))
+    assert PriceTable.load(path).prices['eth_usd'].tolist() == [1700.0, 1750.0, 1800.0, 1850.0]
+    assert app.prices['eth_usd'].tolist() == [1700.0, 1750.0, 1800.0, 1850.0]
+
+
+def test_refresh_reads_prices_saved_elsewhere(tmp_path):
+    path = os.path.join(tmp_path, 'eth_prices.parquet')
+    app = PriceTable.load(path)
+    assert not app.refresh()
+    PriceTable.load(path).append(['2025-03-01'], [1700.0])
+    assert app.refresh()
+    assert app.last == (1700.0, pd.Timestamp('2025-03-01'))
+    assert not app.refresh()
+
+
+def test_record_is_checked_against_the_saved_table(tmp_path):
+    path = os.path.join(tmp_path, 'eth_prices.parquet')
+    app = PriceTable.load(path)
+    PriceTable.load(path).append(['2025-03-10'], [1800.0])
+    # Not later than the price another table saved
+    assert not app.record(1790.0, pd.Timestamp('2025-03-09'))
+    assert len(PriceTable.load(path)) == 1
+
+
+def test_engine_is_rebuilt_only_when_used_prices_change(tmp_path):
+    path = os.path.join(tmp_path, 'eth_prices.parquet')
+    prices = PriceTable.load(path)
+    prices.append(['2025-03-01'], [2000.0])
+    df = transfers(48)
+    engine = MetricsEngine(prices)
+    engine.group_metrics(df.iloc[:24], 'revenue')
+
+    # A live price after the folded rows changes nothing already aggregated
+    prices.record(2100.0, pd.Timestamp('2025-03-01 23:30'))
+    assert engine.accepts(df)
+    engine.group_metrics(df, 'revenue')
+    assert engine.accepts(df)
+
+    # A price imported for folded times does
+    prices.append(['2025-03-01 12:00'], [1000.0])
+    assert not engine.accepts(df)
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import aiohttp
+import pytest
+from aiohttp import web
+import ingest
+from datastore import read_dataset
+
+HEAD = 1200
+
+
+class FakeNode:
+    """
+    Json-rpc node with a few transfers per block, refusing large log ranges and large batches
+    """
+
+    def __init__(self, max_log_blocks=None, slow_log_blocks=None, max_batch=None):
+        self.max_log_blocks = max_log_blocks
+        self.slow_log_blocks = slow_log_blocks
+        self.max_batch = max_batch
+        self.log_ranges = []
+        self.batch_sizes = []
+        self.logs = []
+        for block in range(1000, HEAD + 1, 7):
+            tx_hash = '0x%064x' % block
+            for index in range(2):
+                self.logs.append({'transactionHash': tx_hash, 'blockNumber': hex(block), 'logIndex': hex(index),
+                                  'topics': [ingest.TRANSFER_TOPIC, '0x' + '%064x' % (block + index),
+                                             '0x' + '%064x' % (block * 2)],
+                                  'data': hex(1_500_000 * (index + 1)), 'removed': False})
+
+    async def answer(self, request: dict) -> dict:
+        method, params = request['method'], request['params']
+        if method == 'eth_blockNumber':
+            return {'result': hex(HEAD)}
+        if method == 'eth_getLogs':
+            start, end = int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16)
+            self.log_ranges.append((start, end))
+            if self.slow_log_blocks is not None and end - start + 1 > self.slow_log_blocks:
+                await asyncio.sleep(1)
+            if self.max_log_blocks is not None and end - start + 1 > self.max_log_blocks:
+                return {'error': {'code': -32005, 'message': 'query returned more than 10000 results'}}
+            return {'result': [log for log in self.logs if start <= int(log['blockNumber'], 16) <= end]}
+        if method == 'eth_getTransactionReceipt':
+            return {'result': {'gasUsed': hex(50_000), 'effectiveGasPrice': hex(20 * 10 ** 9)}}
+        if method == 'eth_getBlockByNumber':
+            return {'result': {'timestamp': hex(1_700_000_000 + 12 * int(params[0], 16))}}
+
+    async def handle(self, request):
+        body = await request.json()
+        if not isinstance(body, list):
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'], **await self.answer(body)})
+        self.batch_sizes.append(len(body))
+        if self.max_batch is not None and len(body) > self.max_batch:
+            # Some nodes refuse a whole batch with one error object
+            return web.json_response({'jsonrpc': '2.0', 'id': None,
+                                      'error': {'code': -32600, 'message': 'batch too large'}})
+        return web.json_response([{'jsonrpc': '2.0', 'id': call['id'], **await self.answer(call)} for call in body])
+
+
+async def fetch(url, start, end, timeout=ingest.REQUEST_TIMEOUT, log_range=ingest.LOG_RANGE):
+    async with aiohttp.ClientSession() as session:
+        client = ingest.RpcClient(url, session, timeout=timeout)
+        return await ingest.fetch_segment(client, start, end, log_range)
+
+
+def test_log_ranges_are_halved_until_the_node_accepts_them(serve):
+    node = FakeNode(max_log_blocks=50)
+
+    async def run():
+        async with serve(node.handle) as url:
+            return await fetch(url, 1000, HEAD)
+
+    transfers = asyncio.run(run())
+    assert len(transfers) == len(node.logs)
+    assert transfers['block_number'].is_monotonic_increasing
+    # Every block was asked for by exactly one accepted range
+    accepted = [(start, end) for start, end in node.log_ranges if end - start + 1 <= 50]
+    assert sum(end - start + 1 for start, end in accepted) == HEAD - 1000 + 1
+
+
+def test_log_ranges_are_halved_on_timeouts(serve):
+    node = FakeNode(slow_log_blocks=100)
+
+    async def run():
+        async with serve(node.handle) as url:
+            return await fetch(url, 1000, HEAD, timeout=0.3)
+
+    transfers = asyncio.run(run())
+    assert len(transfers) == len(node.logs)
+    assert any(end - start + 1 <= 100 for start, end in node.log_ranges)
+
+
+def test_receipts_are_batched(serve, monkeypatch):
+    monkeypatch.setattr(ingest, 'BATCH_SIZE', 10)
+    node = FakeNode()
+
+    async def run():
+        async with serve(node.handle) as url:
+            return await fetch(url, 1000, HEAD)
+
+    transfers = asyncio.run(run())
+    transactions = transfers['tx_hash'].nunique()
+    # Receipts and blocks, one call per transaction and per block, in batches of at most 10
+    assert sum(node.batch_sizes) == transactions + transfers['block_number'].nunique()
+    assert max(node.batch_sizes) == 10
+    assert transfers['gas_fees_eth'].eq(50_000 * 20 * 10 ** 9 / 10 ** 18).all()
+    assert transfers['timestamp'].notna().all()
+
+
+def test_refused_batches_are_split(serve, monkeypatch):
+    monkeypatch.setattr(ingest, 'BATCH_SIZE', 16)
+    node = FakeNode(max_batch=5)
+
+    async def run():
+        async with serve(node.handle) as url:
+            return await fetch(url, 1000, HEAD)
+
+    transfers = asyncio.run(run())
+    assert len(transfers) == len(node.logs)
+    assert transfers['gas_fees_eth'].notna().all()
+
+
+def test_single_call_batch_error_raises(serve):
+    node = FakeNode(max_batch=0)
+
+    async def run():
+        async with serve(node.handle) as url:
+            async with aiohttp.ClientSession() as session:
+                client = ingest.RpcClient(url, session)
+                await client.batch('eth_getTransactionReceipt', [['0x01'], ['0x02']])
+
+    with pytest.raises(ingest.RpcError, match='batch too large'):
+        asyncio.run(run())
+
+
+def test_ingest_resumes_after_the_checkpoint(serve, tmp_path):
+    node = FakeNode()
+    path = os.path.join(tmp_path, 'pyusd.parquet')
+    checkpoint_path = os.path.join(tmp_path, 'checkpoint.json')
+
+    async def run():
+        async with serve(node.handle) as url:
+            first = await ingest.ingest(url, 1000, 1099, path, checkpoint_path, segment_blocks=50)
+            assert ingest.read_checkpoint(checkpoint_path) == 1099
+            rest = await ingest.ingest(url, None, None, path, checkpoint_path, segment_blocks=50)
+            again = await ingest.ingest(url, None, None, path, checkpoint_path, segment_blocks=50)
+            return first, rest, again
+
+    first, rest, again = asyncio.run(run())
+    expected = [log for log in node.logs if int(log['blockNumber'], 16) <= HEAD - ingest.CONFIRMATIONS]
+    assert first + rest == len(expected)
+    assert again == 0
+    assert ingest.read_checkpoint(checkpoint_path) == HEAD - ingest.CONFIRMATIONS
+    stored = read_dataset(path)
+    assert len(stored) == len(expected)
+    assert not stored.duplicated(['tx_hash', 'from_address']).any()
@@ -0,0 +1,166 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sheetsync import SheetWriter, read_state, sheet_rows, sync_rows, upload_rows
+
+
+class Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+class APIError(Exception):
+    """
+    Shaped like gspread's APIError, the status is on the response
+    """
+
+    def __init__(self, status_code: int):
+        super().__init__(f'status {status_code}')
+        self.response = Response(status_code)
+
+
+class FakeWorksheet:
+    """
+    Worksheet keeping rows by sheet row number, failing chosen update calls
+    """
+
+    def __init__(self, failures: dict = None):
+        self.cells = {}
+        self.rows = None
+        self.updates = []
+        self.failures = failures or {}
+
+    def resize(self, rows: int):
+        self.rows = rows
+        self.cells = {row: values for row, values in self.cells.items() if row <= rows}
+
+    def update(self, range_name: str, values: list, raw: bool):
+        self.updates.append((range_name, len(values)))
+        error = self.failures.pop(len(self.updates), None)
+        if error is not None:
+            raise error
+        first = int(range_name[1:])
+        for offset, row in enumerate(values):
+            self.cells[first + offset] = row
+
+    def data(self) -> list:
+        return [self.cells[row] for row in sorted(self.cells)]
+
+
+class FakeClock:
+    """
+    Clock advanced by the writer's sleeps
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def transfers(rows: int) -> pd.DataFrame:
+    """
+    Transfers sorted by block, several per block
+    """
+    rng = np.random.default_rng(7)
+    blocks = 1000 + np.sort(rng.integers(0, rows // 3, rows))
+    return pd.DataFrame({
+        'tx_hash': [f'0x{i:064x}' for i in range(rows)],
+        'block_number': blocks,
+        'timestamp': pd.Timestamp('2025-03-01') + pd.to_timedelta(12 * (blocks - 1000), unit='s'),
+        'from_address': [f'0x{i % 17:040x}' for i in range(rows)],
+        'to_address': [f'0x{i % 23:040x}' for i in range(rows)],
+        'amount': rng.random(rows) * 1000,
+        'gas_fees_eth': rng.random(rows) / 1000,
+    })
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return os.path.join(tmp_path, 'progress.json'), os.path.join(tmp_path, 'watermark.json')
+
+
+def test_upload_writes_chunks_below_the_header(paths):
+    progress_path, watermark_path = paths
+    df = transfers(2500)
+    sheet = FakeWorksheet()
+    clock = FakeClock()
+    writer = SheetWriter(sheet, clock=lambda: clock.now, sleep=clock.sleep)
+    seen = []
+    assert upload_rows(sheet, df, progress_path, watermark_path, chunk_rows=1000,
+                       on_chunk=lambda done, total: seen.append((done, total)), writer=writer) == 2500
+    assert sheet.updates == [('A2', 1000), ('A1002', 1000), ('A2002', 500)]
+    assert seen == [(1000, 2500), (2000, 2500), (2500, 2500)]
+    assert sheet.rows == 2501
+    assert sheet.data() == sheet_rows(df)
+    # Requests after the first wait out the rate limit
+    assert clock.sleeps == [1.0, 1.0, 1.0]
+    assert not os.path.exists(progress_path)
+    assert read_state(watermark_path)['rows'] == 2500
+
+
+def test_quota_errors_are_retried_with_backoff(paths):
+    progress_path, watermark_path = paths
+    df = transfers(300)
+    sheet = FakeWorksheet({2: APIError(429), 3: APIError(429), 4: APIError(503)})
+    clock = FakeClock()
+    writer = SheetWriter(sheet, clock=lambda: clock.now, sleep=clock.sleep)
+    assert upload_rows(sheet, df, progress_path, watermark_path, chunk_rows=100, writer=writer) == 300
+    # Backoffs of 1, 2 and 4 seconds between rate limit waits, the backoffs also cover the rate limit
+    assert clock.sleeps == [1.0, 1.0, 1.0, 2.0, 4.0, 1.0]
+    assert sheet.data() == sheet_rows(df)
+
+
+def test_other_errors_are_raised_and_the_upload_resumes(paths):
+    progress_path, watermark_path = paths
+    df = transfers(500)
+    sheet = FakeWorksheet({3: APIError(400)})
+    with pytest.raises(APIError):
+        upload_rows(sheet, df, progress_path, watermark_path, chunk_rows=100,
+                    writer=SheetWriter(sheet, min_interval=0))
+    assert read_state(progress_path)['done'] == 200
+
+    # Only the rows after the last chunk written are sent again
+    assert upload_rows(sheet, df, progress_path, watermark_path, chunk_rows=100,
+                       writer=SheetWriter(sheet, min_interval=0)) == 300
+    assert [update[0] for update in sheet.updates] == ['A2', 'A102', 'A202', 'A202', 'A302', 'A402']
+    assert sheet.data() == sheet_rows(df)
+
+
+def test_retries_give_up_after_max_retries(paths):
+    progress_path, watermark_path = paths
+    sheet = FakeWorksheet({number: APIError(429) for number in range(1, 4)})
+    clock = FakeClock()
+    writer = SheetWriter(sheet, max_retries=2, clock=lambda: clock.now, sleep=clock.sleep)
+    with pytest.raises(APIError):
+        upload_rows(sheet, transfers(10), progress_path, watermark_path, writer=writer)
+    assert len(sheet.updates) == 3
+
+
+def test_sync_appends_only_new_rows(paths):
+    progress_path, watermark_path = paths
+    df = transfers(3000)
+    sheet = FakeWorksheet()
+    assert sync_rows(sheet, df.iloc[:1200], watermark_path, progress_path, chunk_rows=500,
+                     writer=SheetWriter(sheet, min_interval=0)) == 1200
+    # Nothing new, nothing written
+    updates = len(sheet.updates)
+    assert sync_rows(sheet, df.iloc[:1200], watermark_path, progress_path, chunk_rows=500,
+                     writer=SheetWriter(sheet, min_interval=0)) == 0
+    assert len(sheet.updates) == updates
+
+    # Interrupted mid sync, the re-run continues after the last chunk written
+    sheet.failures = {len(sheet.updates) + 2: APIError(400)}
+    with pytest.raises(APIError):
+        sync_rows(sheet, df, watermark_path, progress_path, chunk_rows=500, writer=SheetWriter(sheet, min_interval=0))
+    assert read_state(watermark_path)['rows'] == 1700
+    assert sync_rows(sheet, df, watermark_path, progress_path, chunk_rows=500,
+                     writer=SheetWriter(sheet, min_interval=0)) == 1300
+    assert sync_rows(sheet, df, watermark_path, progress_path, chunk_rows=500,
+                     writer=SheetWriter(sheet, min_interval=0)) == 0
+    assert sheet.rows == 3001
+    assert sheet.data() == sheet_rows(df)
@@ -1,56 +1,197 @@
-from prophet import Prophet
-from prophet.plot import plot_plotly, plot_components_plotly
+import hashlib
+import os
 import pandas as pd
 import numpy as np
 import streamlit as st
+from datastore import FORECAST_DIR
+from ethprices import get_price_table
+from metricsengine import prepare_transactions
+from rollups import period_labels, fill_periods
+from fastforecast import HoltWinters, forecast_steps, plot_holt_winters
 
-@st.cache_data
-def prophet_forecast(df: pd.DataFrame, column: str, periods: int = 14)-> tuple:
+# Prophet is imported where it is used, so the Holt-Winters path never loads it
+
+# Series the forecasts can be fitted on
+FORECAST_FREQS = ('D', 'h')
+FORECAST_AGGS = ('sum', 'mean', 'count')
+# Forecasting backends
+FORECAST_MODELS = ('Prophet', 'Holt-Winters')
+# Fitted models kept on disk, the least recently used are removed first
+MAX_MODELS = 32
+
+
+def aggregate_series(df: pd.DataFrame, column: str, freq: str = 'D', how: str = 'sum') -> pd.DataFrame:
     """
-    Forecasts a column in a DataFrame using Prophet.
+    Aggregates transactions into the series Prophet is fitted on.
     Parameters:
         df (pd.DataFrame): DataFrame containing the data.
-        column (str): Name of the column to forecast.
-        periods (int): Number of periods to forecast into the future.
-    Returns: Model and Forecast.
+        column (str): Name of the column to aggregate.
+        freq (str): Period of the series, D or h.
+        how (str): Aggregate per period, sum, mean or count.
+    Returns: DataFrame with ds and y columns, one row per period.
+    """
+    series = df[column].groupby(period_labels(df['timestamp'], freq).values).agg(how)
+    # Empty periods had no transfers, a mean is unknown rather than zero
+    if how != 'mean':
+        series = fill_periods(series, freq)
+    series = series.dropna()
+    return pd.DataFrame({'ds': series.index, 'y': series.values.astype('float64')})
+
+
+def model_path(fingerprint: str, column: str, freq: str, how: str) -> str:
+    """
+    File of a fitted model, named after the series and a digest of the data fingerprint
+    """
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+    return os.path.join(FORECAST_DIR, f'{column}-{freq}-{how}-{digest}.json')
+
+
+def load_model(path: str):
+    """
+    Loads a fitted model saved with save_model.
+    Parameters:
+        path (str): Model file.
+    Returns: Fitted model, None if there is no file.
+    """
+    from prophet.serialize import model_from_json
+    # The file may be pruned by another worker at any point
+    try:
+        with open(path) as f:
+            model = model_from_json(f.read())
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return model
+
+
+def prune_models(directory: str, max_models: int = MAX_MODELS):
+    """
+    Removes the least recently used models beyond max_models.
+    Parameters:
+        directory (str): Model directory.
+        max_models (int): Number of models kept.
+    """
+    models = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            models.append((os.stat(os.path.join(directory, name)).st_mtime_ns, name))
+        except FileNotFoundError:
+            continue
+    # Oldest first, loading a model refreshes its time
+    for _, name in sorted(models)[:max(len(models) - max_models, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def save_model(model: 'Prophet', path: str, max_models: int = MAX_MODELS):
+    """
+    Saves a fitted model as json, keeping at most max_models models.
+    Parameters:
+        model (Prophet): Fitted model.
+        path (str): Model file, see model_path.
+        max_models (int): Number of models kept, models of other date filter views included.
     """
-    # Create custom dataframe
-    df_prophet = df[['timestamp', column]].rename(columns={'timestamp': 'ds', column: 'y'})
+    from prophet.serialize import model_to_json
+    # Save next to the target and rename, the temporary name is unique per process
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(model_to_json(model))
+    os.replace(tmp_path, path)
+    prune_models(directory, max_models)
 
-    # Convert ds to datetime
-    df_prophet['ds'] = pd.to_datetime(df_prophet['ds'])
-    df_prophet.drop_duplicates(inplace=True)
 
-    # Initialize and fit the Prophet model
-    model = Prophet(weekly_seasonality=True, daily_seasonality=True)
-    model.fit(df_prophet)
+def fit_series(series: pd.DataFrame, freq: str = 'D') -> 'Prophet':
+    """
+    Fits Prophet on an aggregated series.
+    Parameters:
+        series (pd.DataFrame): ds and y columns, see aggregate_series.
+        freq (str): Period of the series, D or h.
+    Returns: Fitted model.
+    """
+    from prophet import Prophet
+    # Daily seasonality needs sub-daily points
+    model = Prophet(weekly_seasonality=True, daily_seasonality=freq == 'h')
+    model.fit(series)
+    return model
 
+
+def predict(model: 'Prophet', periods: int, freq: str = 'D') -> pd.DataFrame:
+    """
+    Forecasts with a fitted model.
+    Parameters:
+        model (Prophet): Fitted model.
+        periods (int): Number of days to forecast into the future.
+        freq (str): Period of the fitted series, D or h.
+    Returns: Forecast DataFrame.
+    """
     # Make future dataframe
-    future = model.make_future_dataframe(periods=periods)
+    future = model.make_future_dataframe(periods=forecast_steps(periods, freq), freq=freq)
+    return model.predict(future)
 
-    # Forecast
-    forecast = model.predict(future)
 
-    return model, forecast
+@st.cache_data(max_entries=16)
+def forecast_series(_df: pd.DataFrame, fingerprint: str, column: str, freq: str = 'D', how: str = 'sum') -> pd.DataFrame:
+    """
+    Aggregates the series to forecast once per data fingerprint.
+    Parameters:
+        _df (pd.DataFrame): DataFrame containing the dataset, not hashed.
+        fingerprint (str): Fingerprint of the data, the cache key for _df.
+        column (str): Name of the column to forecast, amount or gas_fees_usd.
+        freq (str): Period of the series, D or h.
+        how (str): Aggregate per period, sum, mean or count.
+    Returns: DataFrame with ds and y columns, see aggregate_series.
+    """
+    # Only the columns a series needs are prepared, gas fees at the eth price of their time
+    transactions = prepare_transactions(_df[['timestamp', 'amount', 'gas_fees_eth']], get_price_table())
+    return aggregate_series(transactions, column, freq, how)
+
+
+@st.cache_data
+def holt_winters_forecast(_series: pd.DataFrame, fingerprint: str, column: str, periods: int = 14,
+                          freq: str = 'D', how: str = 'sum') -> tuple:
+    """
+    Forecasts a series using Holt-Winters, a quick alternative to the Prophet jobs.
+    Parameters:
+        _series (pd.DataFrame): ds and y columns, see forecast_series, not hashed.
+        fingerprint (str): Fingerprint of the data, with column, freq and how the cache key for _series.
+        column (str): Name of the column forecasted.
+        periods (int): Number of days to forecast into the future.
+        freq (str): Period of the fitted series, D or h.
+        how (str): Aggregate per period, sum, mean or count.
+    Returns: Model and Forecast.
+    """
+    model = HoltWinters(freq).fit(_series)
+    return model, model.predict(periods)
 
 def plot_forecast(model, forecast, column: str)-> tuple:
     """
     Plots the forecast using Plotly.
     Parameters:
-        model: Prophet model.
+        model: Prophet or HoltWinters model.
         forecast: Forecast DataFrame.
         column (str): Name of the column forecasted.
     """
-    fig1 = plot_plotly(model, forecast)
-    fig1.update_layout(title=f"Prophet Forecast for {column}")
+    if isinstance(model, HoltWinters):
+        name = 'Holt-Winters'
+        fig1, fig2 = plot_holt_winters(model, forecast)
+    else:
+        from prophet.plot import plot_plotly, plot_components_plotly
+        name = 'Prophet'
+        fig1, fig2 = plot_plotly(model, forecast), plot_components_plotly(model, forecast)
+    fig1.update_layout(title=f"{name} Forecast for {column}")
     # change line color
     fig1.update_traces(line=dict(color='#CE3104'))
     fig1.update_traces(marker=dict(color='#CE3107'))
     fig1.update_xaxes(showgrid=False)
     fig1.update_yaxes(showgrid=False)
 
-    fig2 = plot_components_plotly(model, forecast)
-    fig2.update_layout(title=f"Prophet Forecast Components for {column}")
+    fig2.update_layout(title=f"{name} Forecast Components for {column}")
     fig2.update_traces(line=dict(color='#CE3107'))
     fig2.update_traces(marker=dict(color='#CE3104'))
     fig2.update_xaxes(showgrid=False)
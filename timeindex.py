@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def sort_transactions(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sorts transactions by block number then timestamp, skipping the sort when already in order
+    Params:
+        dataframe: Dataframe containing pyusd data
+    Returns:
+        Dataframe in (block_number, timestamp) order with a fresh range index
+    """
+    blocks = dataframe['block_number'].to_numpy()
+    # Epoch integers, also for tz-aware timestamps
+    timestamps = pd.DatetimeIndex(pd.to_datetime(dataframe['timestamp'], utc=True)).asi8
+    in_order = np.all((blocks[:-1] < blocks[1:]) |
+                      ((blocks[:-1] == blocks[1:]) & (timestamps[:-1] <= timestamps[1:])))
+    if in_order:
+        return dataframe
+    order = np.lexsort((timestamps, blocks))
+    return dataframe.iloc[order].reset_index(drop=True)
+
+
+class TimeIndex:
+    """
+    Binary search index over transactions sorted by block number and timestamp.
+
+    Holds int64 views of the block and timestamp columns, no copy is made.
+    Block timestamps never decrease, so both columns are sorted. Block
+    ranges resolve to positional slices, which select rows with iloc
+    without scanning or masking the whole frame. Date filtering happens
+    when the store is read, see datastore.read_dataset.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame):
+        timestamps = dataframe['timestamp'].to_numpy()
+        if timestamps.dtype.kind != 'M':
+            timestamps = pd.to_datetime(dataframe['timestamp']).to_numpy()
+        self.unit = np.datetime_data(timestamps.dtype)[0]
+        self.epoch = timestamps.view(np.int64)
+        self.blocks = dataframe['block_number'].to_numpy()
+
+    def __len__(self) -> int:
+        return len(self.epoch)
+
+    @property
+    def first(self) -> pd.Timestamp:
+        return pd.Timestamp(np.datetime64(int(self.epoch[0]), self.unit))
+
+    @property
+    def last(self) -> pd.Timestamp:
+        return pd.Timestamp(np.datetime64(int(self.epoch[-1]), self.unit))
+
+    def block_slice(self, start: int = None, end: int = None) -> slice:
+        """
+        Rows between two blocks
+        Params:
+            start: first block included, from the first row when None
+            end: last block included, to the last row when None
+        Returns:
+            Positional slice
+        """
+        first = 0 if start is None else np.searchsorted(self.blocks, start, side='left')
+        last = len(self) if end is None else np.searchsorted(self.blocks, end, side='right')
+        return slice(int(first), int(last))